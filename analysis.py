@@ -0,0 +1,184 @@
+# analysis.py
+"""
+Batch frame analysis for proctor snapshots.
+
+Validated snapshots (status 'ok') are decoded small and grayscale, stacked
+into one NumPy array per attempt batch, and scored in a few vectorized
+passes:
+
+  brightness  mean luminance (0..1)
+  contrast    luminance standard deviation (0..1)
+  edges       mean absolute horizontal + vertical gradient (0..1)
+  diff        mean absolute difference from the attempt's previous frame
+
+A frame is "blank" when it is nearly uniform and "covered" when it is also
+dark and featureless (lens covered, camera unplugged). Per-frame scores go
+to frame_scores; attempt_suspicion holds the per-attempt roll-up the admin
+results page sorts by. Decoding runs in a process pool; all database work
+stays in the calling process. Run it with scripts/analyze_snapshots.py.
+"""
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+import models
+from storage import SnapshotStore
+
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", os.cpu_count() or 2))
+# frames per worker job; an attempt's frames are split into jobs of this size
+ANALYSIS_BATCH = 256
+FRAME_SIZE = (64, 48)
+# contrast below which a frame counts as blank
+BLANK_CONTRAST = 0.03
+# a blank frame this dark with this little structure counts as a covered camera
+COVERED_BRIGHTNESS = 0.15
+COVERED_EDGES = 0.02
+# diff above which the scene changed (person left, camera moved, someone else)
+SCENE_CHANGE = 0.15
+
+
+def _load(store, key):
+    with store.open(key) as fh, Image.open(fh) as im:
+        # let libjpeg downscale while decoding
+        im.draft("L", FRAME_SIZE)
+        return np.asarray(im.convert("L").resize(FRAME_SIZE), dtype=np.uint8)
+
+
+def score_frames(root, keys, prev_key=None):
+    """
+    Score snapshots of one attempt in order (runs in a worker process).
+
+    prev_key is the attempt's last already-scored frame so the first diff
+    continues the sequence. Returns one (brightness, contrast, edges, diff,
+    blank, covered, scene_change) tuple per key, or None for keys that failed
+    to decode.
+    """
+    store = SnapshotStore(root)
+    decoded = {}
+    for key in dict.fromkeys(([prev_key] if prev_key else []) + list(keys)):
+        # near-duplicate frames share a key; decode each file once
+        try:
+            decoded[key] = _load(store, key)
+        except Exception:
+            decoded[key] = None
+    ok = [k for k in keys if decoded[k] is not None]
+    if not ok:
+        return [None] * len(keys)
+
+    frames = np.stack([decoded[k] for k in ok]).astype(np.float32) / 255.0   # (n, h, w)
+    brightness = frames.mean(axis=(1, 2))
+    contrast = frames.std(axis=(1, 2))
+    edges = (np.abs(np.diff(frames, axis=2)).mean(axis=(1, 2)) +
+             np.abs(np.diff(frames, axis=1)).mean(axis=(1, 2)))
+    diff = np.zeros(len(ok), dtype=np.float32)
+    diff[1:] = np.abs(np.diff(frames, axis=0)).mean(axis=(1, 2))
+    if prev_key and decoded.get(prev_key) is not None:
+        diff[0] = np.abs(frames[0] - decoded[prev_key].astype(np.float32) / 255.0).mean()
+    blank = contrast < BLANK_CONTRAST
+    covered = blank & (brightness < COVERED_BRIGHTNESS) & (edges < COVERED_EDGES)
+    scene_change = diff >= SCENE_CHANGE
+
+    rows = dict(zip(ok, zip(brightness.tolist(), contrast.tolist(), edges.tolist(), diff.tolist(),
+                            blank.astype(int).tolist(), covered.astype(int).tolist(),
+                            scene_change.astype(int).tolist())))
+    return [rows.get(k) if decoded[k] is not None else None for k in keys]
+
+
+_PENDING_SQL = """
+SELECT p.id, p.attempt_id, p.filename
+FROM proctor_images p
+LEFT JOIN frame_scores f ON f.image_id = p.id
+WHERE f.image_id IS NULL AND p.status = 'ok'
+ORDER BY p.attempt_id, p.timestamp, p.id
+LIMIT ?
+"""
+
+_LAST_SCORED_SQL = """
+SELECT p.filename FROM frame_scores f JOIN proctor_images p ON p.id = f.image_id
+WHERE f.attempt_id = ? ORDER BY p.timestamp DESC, p.id DESC LIMIT 1
+"""
+
+_ROLLUP_SQL = """
+INSERT INTO attempt_suspicion (attempt_id, frames, blank_frames, covered_frames, scene_changes,
+                               max_diff, suspicion, updated_at)
+SELECT attempt_id, frames, blank_frames, covered_frames, scene_changes, max_diff,
+       ROUND(CAST(100 * CASE WHEN weighted > frames THEN 1.0 ELSE weighted / frames END AS NUMERIC), 1),
+       CAST(CURRENT_TIMESTAMP AS TEXT)
+FROM (
+    SELECT attempt_id, COUNT(*) AS frames, SUM(blank) AS blank_frames, SUM(covered) AS covered_frames,
+           SUM(scene_change) AS scene_changes, MAX(diff) AS max_diff,
+           0.6 * SUM(covered) + 0.3 * SUM(CASE WHEN blank=1 AND covered=0 THEN 1 ELSE 0 END)
+               + 0.3 * SUM(scene_change) AS weighted
+    FROM frame_scores
+    WHERE attempt_id IN (SELECT value FROM {ids} AS p)
+    GROUP BY attempt_id
+) AS r
+WHERE true
+ON CONFLICT(attempt_id) DO UPDATE SET
+    frames=excluded.frames, blank_frames=excluded.blank_frames, covered_frames=excluded.covered_frames,
+    scene_changes=excluded.scene_changes, max_diff=excluded.max_diff, suspicion=excluded.suspicion,
+    updated_at=excluded.updated_at
+"""
+
+
+def update_suspicion(cur, attempt_ids):
+    """Recompute attempt_suspicion for the given attempts from their frame_scores."""
+    ids = [int(a) for a in attempt_ids]
+    if ids:
+        cur.execute(_ROLLUP_SQL.format(ids=models.backend.ids), (json.dumps(ids),))
+
+
+def analyze_pending(conn, upload_dir, workers=ANALYSIS_WORKERS, limit=10000):
+    """
+    Score up to `limit` unscored snapshots and refresh their attempts'
+    suspicion. Returns the number of snapshots scored (0 when caught up).
+    """
+    cur = conn.cursor()
+    cur.execute(_PENDING_SQL, (limit,))
+    pending = cur.fetchall()
+    if not pending:
+        return 0
+
+    jobs = []
+    by_attempt = {}
+    for row in pending:
+        by_attempt.setdefault(row['attempt_id'], []).append(row)
+    for attempt_id, rows in by_attempt.items():
+        cur.execute(_LAST_SCORED_SQL, (attempt_id,))
+        last = cur.fetchone()
+        prev_key = last['filename'] if last else None
+        for i in range(0, len(rows), ANALYSIS_BATCH):
+            chunk = rows[i:i + ANALYSIS_BATCH]
+            jobs.append((attempt_id, chunk, prev_key))
+            prev_key = chunk[-1]['filename']
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(score_frames, upload_dir, [r['filename'] for r in chunk], prev_key)
+                   for _, chunk, prev_key in jobs]
+        results = [f.result() for f in futures]
+
+    params = []
+    for (attempt_id, chunk, _), scores in zip(jobs, results):
+        for row, s in zip(chunk, scores):
+            if s is None:
+                # undecodable now (e.g. file gone): store an empty row so it is not retried forever
+                s = (None, None, None, None, 0, 0, 0)
+            params.append((row['id'], attempt_id, *s))
+    with models.backend.write_lock():
+        models.backend.begin_write(cur)
+        try:
+            cur.executemany("""
+                INSERT INTO frame_scores
+                    (image_id, attempt_id, brightness, contrast, edges, diff, blank, covered, scene_change)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(image_id) DO UPDATE SET
+                    attempt_id=excluded.attempt_id, brightness=excluded.brightness, contrast=excluded.contrast,
+                    edges=excluded.edges, diff=excluded.diff, blank=excluded.blank, covered=excluded.covered,
+                    scene_change=excluded.scene_change, analyzed_at=CAST(CURRENT_TIMESTAMP AS TEXT)""", params)
+            update_suspicion(cur, by_attempt.keys())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(params)
@@ -1,15 +1,30 @@
 # app.py
 import os
-import uuid
 import base64
-import time
-import sqlite3
+import json
+import hashlib
+import zipfile
 from datetime import datetime, timedelta, timezone
 from flask import (Flask, render_template, request, redirect, url_for,
-                   session, flash, jsonify, send_from_directory, abort)
-from werkzeug.utils import secure_filename
-from threading import Lock                       # <--- added
-from models import init_db, get_conn, create_user, verify_user
+                   session, flash, jsonify, send_from_directory, abort, Response)
+from werkzeug.utils import secure_filename, safe_join
+from markupsafe import Markup
+from models import (init_db, init_app, get_conn, create_user, verify_user, pool_stats, find_user, list_exams,
+                    get_exam, exam_questions, create_exam as db_create_exam, update_exam, recent_attempts,
+                    user_attempts, insert_attempt, get_attempt, upsert_answer, insert_snapshot, finalize_attempt,
+                    results_page, results_summary, attempt_detail, attempt_snapshots, EVENT_INSERT_SQL)
+from writer import WriteQueue
+from stats import StatsCache
+from pubsub import PubSub, Relay
+from ingest import ImageIngest
+from storage import SnapshotStore, PackStore
+from attempt_cache import AttemptCache
+from exam_cache import ExamCache
+from deadlines import DeadlineSweeper
+import grading
+import metrics
+import exam_io
+import selection
 
 # ---- Configuration ----
 UPLOAD_IMG = "uploads/proctor_images"
@@ -20,23 +35,65 @@ MAX_MB = 6
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET", "replace-with-a-secure-random-key")
 app.config['MAX_CONTENT_LENGTH'] = MAX_MB * 1024 * 1024
+app.config['DB_POOL_SIZE'] = int(os.environ.get("DB_POOL_SIZE", 8))
+# "files" (content-addressed, deduplicated) or "pack" (one append-only file per attempt)
+app.config['SNAPSHOT_STORAGE'] = os.environ.get("SNAPSHOT_STORAGE", "files")
+# let a front proxy send snapshot files: "" (Flask sends), "x-sendfile" (Apache/lighttpd)
+# or "x-accel" (nginx internal location mapped to IMAGE_ACCEL_PREFIX)
+app.config['IMAGE_SENDFILE'] = os.environ.get("IMAGE_SENDFILE", "")
+app.config['IMAGE_ACCEL_PREFIX'] = os.environ.get("IMAGE_ACCEL_PREFIX", "/protected/proctor_images/")
+app.config['USE_X_SENDFILE'] = app.config['IMAGE_SENDFILE'] == "x-sendfile"
+# client-side snapshot skipping: minimum mean luminance change (0..1, 0 uploads
+# every frame) and the longest gap before a frame is uploaded regardless
+app.config['FRAME_CHANGE_THRESHOLD'] = float(os.environ.get("FRAME_CHANGE_THRESHOLD", 0.04))
+app.config['FRAME_KEYFRAME_SECS'] = int(os.environ.get("FRAME_KEYFRAME_SECS", 120))
+# answers arriving this long after allowed_until are still accepted (in-flight autosaves)
+app.config['ANSWER_GRACE_SECS'] = int(os.environ.get("ANSWER_GRACE_SECS", 30))
+# close attempts server-side once their deadline plus the grace above has passed
+app.config['DEADLINE_SWEEPER'] = os.environ.get("DEADLINE_SWEEPER", "1") == "1"
+# set by server.py: the app is imported once in the master, background threads
+# start in each worker after fork, and notifications are relayed between workers
+app.config['PREFORK'] = os.environ.get("EXAM_PREFORK") == "1"
+app.config['PUBSUB_RELAY_DIR'] = os.environ.get("PUBSUB_RELAY_DIR", "")
+
+# pooled database connections (models.backend), returned to the pool at request teardown
+init_app(app)
+
+# per-endpoint latency and SQL timings, served at /metrics
+metrics.init_app(app)
+
+# single writer thread that group-commits the hot write paths
+writer = WriteQueue(get_conn)
+
+# dashboard counters served from memory, kept current by the write paths
+stats = StatsCache(get_conn)
+
+# notifications for the /api/stream SSE endpoint (relayed to sibling workers under server.py)
+hub = PubSub(Relay(app.config['PUBSUB_RELAY_DIR']) if app.config['PUBSUB_RELAY_DIR'] else None)
+
+# exam rows, served questions and their rendered markup, per exam version
+def _render_questions(exam, questions):
+    return Markup(render_template("exam_questions.html", exam=exam, questions=questions))
+
+
+exam_cache = ExamCache(get_conn, _render_questions)
+
+# content-addressed snapshot files, validated/thumbnailed off the request path
+store = (PackStore if app.config['SNAPSHOT_STORAGE'] == "pack" else SnapshotStore)(UPLOAD_IMG)
+ingest = ImageIngest(store, writer)
 
 # Demo hard-coded admin credentials (fallback) - remove in production
 ADMIN_USERNAME = os.environ.get("DEMO_ADMIN_USER", "admin123")
 ADMIN_PASSWORD = os.environ.get("DEMO_ADMIN_PASS", "admin_123@45")
 
-# initialize DB
+# initialize DB (once per server: server.py imports the app in the master before forking)
 init_db()
 
 # Ensure demo admin exists in DB (best-effort)
 def ensure_demo_admin():
     try:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE username= ?", (ADMIN_USERNAME,))
-        if not cur.fetchone():
+        if not find_user(ADMIN_USERNAME):
             create_user(ADMIN_USERNAME, ADMIN_PASSWORD, is_admin=1)
-        conn.close()
     except Exception:
         pass
 
@@ -67,6 +124,73 @@ def parse_iso_datetime(s: str) -> datetime:
         d = d.replace(tzinfo=timezone.utc)
     return d
 
+# owner/exam/deadline/question ids of running attempts for the write endpoints
+active_attempts = AttemptCache(get_conn, parse_iso_datetime)
+
+
+def _write_denied(att, answering=False):
+    """
+    Error response when the logged-in student may not write to the attempt,
+    else None. Answers also need an unsubmitted attempt within its deadline.
+    """
+    if session.get('user_id') != att.user_id:
+        return jsonify({"status":"error", "msg":"not your attempt"}), 403
+    if answering:
+        if att.submitted:
+            return jsonify({"status":"error", "msg":"attempt already submitted"}), 409
+        grace = timedelta(seconds=app.config['ANSWER_GRACE_SECS'])
+        if att.allowed_until is not None and datetime.now(timezone.utc) > att.allowed_until + grace:
+            return jsonify({"status":"error", "msg":"time is up"}), 409
+    return None
+
+
+def _attempt_closed(att):
+    # the database refused an answer: the attempt was submitted, maybe by another process
+    active_attempts.invalidate(att.id)
+    return jsonify({"status":"error", "msg":"attempt already submitted"}), 409
+
+
+def _attempts_closed(rows):
+    # called by the sweeper after each batch of expired attempts is graded and closed
+    for attempt_id, user_id, score in rows:
+        active_attempts.invalidate(attempt_id)
+        stats.attempt_submitted(user_id, score)
+        hub.publish("admin", "attempt_submitted", {"attempt_id": attempt_id, "score": score, "auto": True})
+        hub.publish(f"user:{user_id}", "attempt_submitted")
+
+
+# open attempts by deadline; expired ones are graded and closed in batches
+sweeper = DeadlineSweeper(get_conn, writer, parse_iso_datetime,
+                          grace_secs=app.config['ANSWER_GRACE_SECS'], on_closed=_attempts_closed)
+
+
+def start_background():
+    """Start this process's background threads; server.py calls it in every worker after fork."""
+    hub.start()
+    if app.config['DEADLINE_SWEEPER']:
+        sweeper.ensure_started()
+
+
+def stop_background(timeout=10):
+    """Let queued snapshot validation and writes finish (worker shutdown)."""
+    try:
+        ingest.drain(timeout)
+    finally:
+        writer.stop(timeout)
+    if hub.relay is not None:
+        hub.relay.close()
+
+
+if not app.config['PREFORK']:
+    start_background()
+
+metrics.REGISTRY.gauge("writer_queue_depth", "Write intents waiting for the writer thread.", writer.depth)
+metrics.REGISTRY.gauge("db_pool_open_connections", "Pooled connections currently open.",
+                       lambda: pool_stats()["opened"])
+metrics.REGISTRY.gauge("db_pool_idle_connections", "Pooled connections idle in the pool.",
+                       lambda: pool_stats()["idle"])
+metrics.REGISTRY.gauge("deadline_sweeper_pending", "Open attempts waiting for their deadline.", sweeper.pending)
+
 # ------------------ AUTH ------------------
 @app.route("/admin_login", methods=["GET", "POST"])
 def admin_login():
@@ -84,10 +208,7 @@ def admin_login():
         # fallback demo credentials
         if uname == ADMIN_USERNAME and pwd == ADMIN_PASSWORD:
             try:
-                conn = get_conn(); cur = conn.cursor()
-                cur.execute("SELECT * FROM users WHERE username= ?", (ADMIN_USERNAME,))
-                row = cur.fetchone()
-                conn.close()
+                row = find_user(ADMIN_USERNAME)
                 if row:
                     session['user_id'] = row['id']
                     session['username'] = row['username']
@@ -150,17 +271,7 @@ def logout():
 def admin_dashboard():
     if 'user_id' not in session or not session.get('is_admin'):
         return redirect(url_for("admin_login"))
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM exams")
-    exams = cur.fetchall()
-    cur.execute("""SELECT a.*, u.username AS username, e.title AS exam_title
-                   FROM attempts a
-                   LEFT JOIN users u ON u.id=a.user_id
-                   LEFT JOIN exams e ON e.id=a.exam_id
-                   ORDER BY a.start_time DESC LIMIT 50""")
-    attempts = cur.fetchall()
-    conn.close()
-    return render_template("admin_dashboard.html", exams=exams, attempts=attempts)
+    return render_template("admin_dashboard.html", exams=list_exams(), attempts=recent_attempts(50))
 
 # ------------------ STUDENT DASHBOARD ------------------
 @app.route("/")
@@ -168,18 +279,33 @@ def admin_dashboard():
 def student_dashboard():
     if 'user_id' not in session or session.get('is_admin'):
         return redirect(url_for("login"))
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM exams")
-    exams = cur.fetchall()
-    cur.execute("""SELECT a.*, e.title FROM attempts a
-                   JOIN exams e ON e.id=a.exam_id
-                   WHERE a.user_id=?
-                   ORDER BY a.start_time DESC""", (session['user_id'],))
-    attempts = cur.fetchall()
-    conn.close()
-    return render_template("student_dashboard.html", exams=exams, attempts=attempts)
+    return render_template("student_dashboard.html", exams=list_exams(), attempts=user_attempts(session['user_id']))
 
 # ------------------ ADMIN: CREATE EXAM ------------------
+def _form_questions(form, slots):
+    """Questions typed into the create/edit form (q1..qN fields); empty slots are skipped."""
+    questions = []
+    for i in range(1, slots + 1):
+        q = form.get(f"q{i}")
+        if not q:
+            continue
+        questions.append({"q_index": i, "question": q,
+                          "option_a": form.get(f"a{i}"), "option_b": form.get(f"b{i}"),
+                          "option_c": form.get(f"c{i}"), "option_d": form.get(f"d{i}"),
+                          "correct": form.get(f"corr{i}"), "pool": (form.get(f"pool{i}") or "").strip() or None})
+    return questions
+
+
+def _insert_exam(title, duration, max_q, questions, randomize=0):
+    exam_id = db_create_exam(title, duration, max_q, questions, randomize)
+    # ids can be reused after scripts/clear_db.py; never serve an old payload
+    exam_cache.invalidate(exam_id)
+    stats.exam_created()
+    hub.publish("admin", "exam_created", {"exam_id": exam_id, "title": title})
+    hub.publish("students", "exam_created")
+    return exam_id
+
+
 @app.route("/admin/create_exam", methods=["GET", "POST"])
 def create_exam():
     if 'user_id' not in session or not session.get('is_admin'):
@@ -187,21 +313,10 @@ def create_exam():
     if request.method == "POST":
         title = request.form.get("title")
         duration = int(request.form.get("duration") or 60)
-        max_q = min(50, int(request.form.get("max_questions") or 50))
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("INSERT INTO exams (title, duration_minutes, max_questions) VALUES (?,?,?)",
-                    (title, duration, max_q))
-        exam_id = cur.lastrowid
-        for i in range(1, max_q + 1):
-            q = request.form.get(f"q{i}")
-            if not q:
-                continue
-            a = request.form.get(f"a{i}"); b = request.form.get(f"b{i}")
-            c = request.form.get(f"c{i}"); d = request.form.get(f"d{i}")
-            corr = request.form.get(f"corr{i}")
-            cur.execute("""INSERT INTO questions (exam_id, q_index, question, option_a, option_b, option_c, option_d, correct)
-                           VALUES (?,?,?,?,?,?,?,?)""", (exam_id, i, q, a, b, c, d, corr))
-        conn.commit(); conn.close()
+        max_q = max(1, int(request.form.get("max_questions") or 50))
+        slots = request.form.get("question_slots", max_q, type=int)
+        randomize = 1 if request.form.get("randomize") else 0
+        _insert_exam(title, duration, max_q, _form_questions(request.form, slots), randomize)
         flash("Exam created", "success")
         return redirect(url_for("admin_dashboard"))
     return render_template("create_exam.html")
@@ -211,200 +326,350 @@ def create_exam():
 def edit_exam(exam_id):
     if 'user_id' not in session or not session.get('is_admin'):
         return redirect(url_for("admin_login"))
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM exams WHERE id=?", (exam_id,))
-    exam = cur.fetchone()
+    exam = get_exam(exam_id)
     if not exam:
-        conn.close(); abort(404)
+        abort(404)
     if request.method == "POST":
         title = request.form.get("title")
         duration = int(request.form.get("duration") or exam['duration_minutes'])
-        max_q = min(50, int(request.form.get("max_questions") or exam['max_questions']))
-        cur.execute("UPDATE exams SET title=?, duration_minutes=?, max_questions=? WHERE id= ?",
-                    (title, duration, max_q, exam_id))
-        cur.execute("DELETE FROM questions WHERE exam_id=?", (exam_id,))
-        for i in range(1, max_q + 1):
-            q = request.form.get(f"q{i}")
-            if not q:
-                continue
-            a = request.form.get(f"a{i}"); b = request.form.get(f"b{i}")
-            c = request.form.get(f"c{i}"); d = request.form.get(f"d{i}")
-            corr = request.form.get(f"corr{i}")
-            cur.execute("""INSERT INTO questions (exam_id, q_index, question, option_a, option_b, option_c, option_d, correct)
-                           VALUES (?,?,?,?,?,?,?,?)""", (exam_id, i, q, a, b, c, d, corr))
-        conn.commit(); conn.close()
-        flash("Exam updated", "success")
+        max_q = max(1, int(request.form.get("max_questions") or exam['max_questions']))
+        slots = request.form.get("question_slots", max_q, type=int)
+        randomize = 1 if request.form.get("randomize") else 0
+        try:
+            counts = update_exam(exam_id, _form_questions(request.form, slots), title=title or None,
+                                 duration=duration, max_questions=max_q, randomize=randomize)
+        except exam_io.ExamFormatError as e:
+            flash("Exam not saved: " + "; ".join(e.errors), "danger")
+            return redirect(url_for("edit_exam", exam_id=exam_id))
+        if counts is None:
+            abort(404)
+        _exam_changed(exam_id)
+        flash("Exam updated ({updated} edited, {inserted} added, {deleted} removed)".format(**counts), "success")
         return redirect(url_for("admin_dashboard"))
-    cur.execute("SELECT * FROM questions WHERE exam_id=? ORDER BY q_index", (exam_id,))
-    questions = cur.fetchall()
-    conn.close()
-    return render_template("edit_exam.html", exam=exam, questions=questions)
+    questions = exam_questions(exam_id)
+    return render_template("edit_exam.html", exam=exam, questions=questions,
+                           slots=max(exam['max_questions'], len(questions)))
+
+
+def _exam_changed(exam_id):
+    # question set changed; running attempts and the compiled exam reload it
+    active_attempts.invalidate_exam(exam_id)
+    exam_cache.invalidate(exam_id)
+
+
+# ------------------ ADMIN: EXAM IMPORT / EXPORT ------------------
+# Bulk question sets as JSON ({"title", "duration_minutes", "max_questions",
+# "questions": [{"question", "option_a".."option_d", "correct"}, ...]}) or CSV
+# with those question columns. Upload a "file" form field, or POST the raw
+# body as application/json or text/csv (exam settings then come from the
+# query string). Everything is validated before one transaction writes it.
+def _read_import():
+    upload = request.files.get("file")
+    if upload is not None:
+        fmt = "csv" if (upload.filename or "").lower().endswith(".csv") else "json"
+        stream = upload.stream
+    else:
+        fmt = "csv" if request.mimetype in ("text/csv", "application/csv") else "json"
+        stream = request.stream
+    if fmt == "csv":
+        settings, questions = {}, exam_io.parse_csv(stream)
+    else:
+        settings, questions = exam_io.parse_json(stream)
+    for key, form_key in (("title", "title"), ("duration_minutes", "duration"), ("max_questions", "max_questions"),
+                          ("randomize", "randomize")):
+        value = request.values.get(form_key)
+        if value:
+            settings[key] = value
+    return settings, questions
+
+
+def _flag(value):
+    # JSON true/false or form/query strings such as "1", "on", "true"
+    if isinstance(value, str):
+        return 1 if value.strip().lower() in ("1", "on", "true", "yes") else 0
+    return 1 if value else 0
+
+
+def _import_failed(errors, back):
+    if request.files:
+        flash("Import failed: " + "; ".join(errors), "danger")
+        return redirect(back)
+    return jsonify({"status": "error", "errors": errors}), 400
+
+
+def _import_done(exam_id, counts):
+    if request.files:
+        flash("Imported {inserted} new, {updated} edited, {deleted} removed question(s)".format(**counts), "success")
+        return redirect(url_for("edit_exam", exam_id=exam_id))
+    return jsonify({"status": "ok", "exam_id": exam_id, **counts})
+
+
+@app.route("/admin/exam/import", methods=["POST"])
+def import_exam():
+    if 'user_id' not in session or not session.get('is_admin'):
+        return redirect(url_for("admin_login"))
+    try:
+        settings, questions = _read_import()
+        title = settings.get("title") or "Imported exam"
+        duration = int(settings.get("duration_minutes") or 60)
+        max_q = max(1, int(settings.get("max_questions") or len(questions) or 1))
+        randomize = _flag(settings.get("randomize"))
+    except exam_io.ExamFormatError as e:
+        return _import_failed(e.errors, url_for("create_exam"))
+    except ValueError:
+        return _import_failed(["duration_minutes and max_questions must be numbers"], url_for("create_exam"))
+    exam_id = _insert_exam(title, duration, max_q, questions, randomize)
+    return _import_done(exam_id, {"kept": 0, "moved": 0, "updated": 0, "inserted": len(questions), "deleted": 0})
+
+
+@app.route("/admin/exam/<int:exam_id>/import", methods=["POST"])
+def import_exam_questions(exam_id):
+    if 'user_id' not in session or not session.get('is_admin'):
+        return redirect(url_for("admin_login"))
+    back = url_for("edit_exam", exam_id=exam_id)
+    try:
+        settings, questions = _read_import()
+        duration = int(settings["duration_minutes"]) if "duration_minutes" in settings else None
+        max_q = max(1, int(settings["max_questions"])) if "max_questions" in settings else None
+        randomize = _flag(settings["randomize"]) if "randomize" in settings else None
+    except exam_io.ExamFormatError as e:
+        return _import_failed(e.errors, back)
+    except ValueError:
+        return _import_failed(["duration_minutes and max_questions must be numbers"], back)
+    try:
+        counts = update_exam(exam_id, questions, title=settings.get("title"), duration=duration,
+                             max_questions=max_q, randomize=randomize)
+    except exam_io.ExamFormatError as e:
+        return _import_failed(e.errors, back)
+    if counts is None:
+        abort(404)
+    _exam_changed(exam_id)
+    return _import_done(exam_id, counts)
+
+
+@app.route("/admin/exam/<int:exam_id>/export.<fmt>")
+def export_exam(exam_id, fmt):
+    if 'user_id' not in session or not session.get('is_admin'):
+        return redirect(url_for("admin_login"))
+    if fmt not in ("json", "csv"):
+        abort(404)
+    exam = get_exam(exam_id)
+    if not exam:
+        abort(404)
+    questions = exam_questions(exam_id)
+    body = exam_io.export_csv(questions) if fmt == "csv" else exam_io.export_json(exam, questions)
+    return Response(body, mimetype="text/csv" if fmt == "csv" else "application/json",
+                    headers={"Content-Disposition": f"attachment; filename=exam_{exam_id}.{fmt}"})
 
 # ------------------ START EXAM (STUDENT) ------------------
+# The exam, its questions and their markup come from exam_cache; the only
+# per-student database work is inserting the attempt.
 @app.route("/start_exam/<int:exam_id>")
 def start_exam(exam_id):
     if 'user_id' not in session or session.get('is_admin'):
         return redirect(url_for("login"))
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM exams WHERE id=?", (exam_id,))
-    exam = cur.fetchone()
-    if not exam:
-        conn.close(); flash("Exam not found", "danger"); return redirect(url_for("student_dashboard"))
+    payload = exam_cache.get(exam_id)
+    if payload is None:
+        flash("Exam not found", "danger"); return redirect(url_for("student_dashboard"))
+    exam = payload.exam
+    if exam['randomize']:
+        # stratified draw from the exam's pools, rendered for this attempt only
+        question_ids = selection.draw(payload.pools, exam['max_questions'])
+        questions_html = _render_questions(exam, [payload.by_id[qid] for qid in question_ids])
+    else:
+        question_ids, questions_html = payload.question_ids, payload.questions_html
     start = datetime.now(timezone.utc)
     allowed_until = start + timedelta(minutes=exam['duration_minutes'])
-    cur.execute("INSERT INTO attempts (user_id, exam_id, start_time, allowed_until) VALUES (?,?,?,?)",
-                (session['user_id'], exam_id, start.isoformat(), allowed_until.isoformat()))
-    attempt_id = cur.lastrowid
-    cur.execute("SELECT * FROM questions WHERE exam_id=? ORDER BY q_index LIMIT ?", (exam_id, exam['max_questions']))
-    questions = cur.fetchall()
-    conn.commit(); conn.close()
+    attempt_id = insert_attempt(session['user_id'], exam_id, start.isoformat(), allowed_until.isoformat(),
+                                selection.pack(question_ids))
+    active_attempts.put(attempt_id, session['user_id'], exam_id, allowed_until, question_ids)
+    if app.config['DEADLINE_SWEEPER']:
+        sweeper.schedule(attempt_id, allowed_until)
+    stats.attempt_started(session['user_id'])
+    hub.publish("admin", "attempt_started", {"attempt_id": attempt_id, "exam_id": exam_id,
+                                             "exam_title": exam['title'], "username": session.get('username')})
+    hub.publish(f"user:{session['user_id']}", "attempt_started")
     allowed_until_iso = allowed_until.isoformat()
-    return render_template("exam.html", exam=exam, questions=questions, attempt_id=attempt_id, allowed_until=allowed_until_iso)
+    frame_change = {"threshold": app.config['FRAME_CHANGE_THRESHOLD'],
+                    "keyframe_secs": app.config['FRAME_KEYFRAME_SECS']}
+    return render_template("exam.html", exam=exam, questions_html=questions_html, attempt_id=attempt_id,
+                           allowed_until=allowed_until_iso, frame_change=frame_change)
 
 # ------------------ AUTOSAVE ANSWER ------------------
-# minimal changes here: validate FK and add db_lock + retry/backoff
-db_lock = Lock()  # global lock to serialize writers and avoid 'database is locked'
-
+# Writes go through the single writer thread (group commit) instead of a
+# process-wide lock; the attempt and its question ids are validated from
+# the in-memory attempt cache.
 @app.route("/save_answer", methods=["POST"])
 def save_answer():
     data = request.get_json()
-    attempt_id = data.get("attempt_id")
     question_id = data.get("question_id")
     selected = data.get("selected")
 
-    # Lock around DB operations that write
-    with db_lock:
-        conn = get_conn(); cur = conn.cursor()
+    # Validate attempt exists (prevents foreign key failure)
+    att = active_attempts.get(data.get("attempt_id"))
+    if att is None:
+        return jsonify({"status":"error", "msg":"attempt not found"}), 404
+    denied = _write_denied(att, answering=True)
+    if denied:
+        return denied
 
-        # Validate attempt exists (prevents foreign key failure)
-        cur.execute("SELECT id FROM attempts WHERE id=?", (attempt_id,))
-        if not cur.fetchone():
-            conn.close(); return jsonify({"status":"error", "msg":"attempt not found"}), 404
+    # Validate the question was served in this attempt
+    try:
+        question_id = int(question_id)
+    except (TypeError, ValueError):
+        question_id = None
+    if question_id not in att.question_ids:
+        return jsonify({"status":"error", "msg":"question not found"}), 404
+
+    # answers must be on disk before we tell the client they are saved
+    if not writer.submit(lambda cur: upsert_answer(cur, att.id, question_id, selected), durable=True):
+        return _attempt_closed(att)
+    return jsonify({"status":"ok"})
 
-        # Validate question exists (prevents foreign key failure)
-        cur.execute("SELECT id FROM questions WHERE id=?", (question_id,))
-        if not cur.fetchone():
-            conn.close(); return jsonify({"status":"error", "msg":"question not found"}), 404
+# ------------------ AUTOSAVE ANSWERS (BATCH) ------------------
+# {"attempt_id": .., "answers": [{"question_id": .., "selected": ..}, ...]}
+# Later entries for the same question win. Also accepts sendBeacon bodies.
+MAX_BATCH_ANSWERS = 1000
+
+@app.route("/save_answers", methods=["POST"])
+def save_answers():
+    data = request.get_json(force=True, silent=True) or {}
+    attempt_id = data.get("attempt_id")
+    items = data.get("answers") or []
+    if not isinstance(items, list) or len(items) > MAX_BATCH_ANSWERS:
+        return jsonify({"status":"error", "msg":"invalid answers"}), 400
+
+    # coalesce: last write wins per question
+    latest = {}
+    for item in items:
+        try:
+            latest[int(item.get("question_id"))] = item.get("selected")
+        except (AttributeError, TypeError, ValueError):
+            continue
+
+    att = active_attempts.get(attempt_id)
+    if att is None:
+        return jsonify({"status":"error", "msg":"attempt not found"}), 404
+    denied = _write_denied(att, answering=True)
+    if denied:
+        return denied
+    valid = att.question_ids
+
+    rows = [(qid, sel) for qid, sel in latest.items() if qid in valid]
+
+    def write(cur):
+        return all([upsert_answer(cur, att.id, qid, sel) for qid, sel in rows])
+
+    if rows and not writer.submit(write, durable=True):
+        return _attempt_closed(att)
+    return jsonify({"status":"ok", "saved": len(rows),
+                    "rejected": [qid for qid in latest if qid not in valid]})
 
-        # Retry writes to avoid transient sqlite 'database is locked' errors
-        max_retries = 5
-        for i in range(max_retries):
-            try:
-                cur.execute("SELECT id FROM answers WHERE attempt_id=? AND question_id=?", (attempt_id, question_id))
-                existing = cur.fetchone()
-                if existing:
-                    cur.execute("UPDATE answers SET selected=? WHERE id=?", (selected, existing["id"]))
-                else:
-                    cur.execute("INSERT INTO answers (attempt_id, question_id, selected) VALUES (?,?,?)",
-                                (attempt_id, question_id, selected))
-                conn.commit()
-                break
-            except sqlite3.OperationalError as e:
-                if 'locked' in str(e).lower() and i < max_retries - 1:
-                    time.sleep(0.1 * (i + 1))
-                    continue
-                else:
-                    conn.close()
-                    raise
-        conn.close()
-    return jsonify({"status":"ok"})
 
 # ------------------ PROCTOR: UPLOAD IMAGE ------------------
+# Accepts, in order of preference:
+#   * multipart form with the JPEG as a file part "image" (canvas.toBlob)
+#   * a raw application/octet-stream or image/jpeg body, attempt_id in the query string
+#   * the legacy form field "image" holding a base64 data URL
+# Binary bodies are streamed into the content-addressed store in chunks and
+# never held in memory whole; identical frames are stored once.
 @app.route("/proctor/upload_image", methods=["POST"])
 def proctor_upload_image():
-    attempt_id = request.form.get("attempt_id")
-    imgdata = request.form.get("image")
-    if not imgdata:
+    raw_body = request.mimetype in ("application/octet-stream", "image/jpeg")
+    attempt_id = request.args.get("attempt_id") if raw_body else request.form.get("attempt_id")
+    upload = None if raw_body else request.files.get("image")
+    imgdata = None
+    if not raw_body and upload is None:
+        imgdata = request.form.get("image")
+        if not imgdata:
+            return jsonify({"status":"error","msg":"no image"}), 400
+
+    # Validate attempt and owner before touching the disk
+    att = active_attempts.get(attempt_id)
+    if att is None:
+        return jsonify({"status":"error","msg":"invalid attempt_id"}), 400
+    denied = _write_denied(att)
+    if denied:
+        return denied
+    attempt_id = att.id
+
+    if imgdata is not None:
+        try:
+            header, encoded = imgdata.split(",", 1)
+        except Exception:
+            return jsonify({"status":"error","msg":"invalid image data"}), 400
+        try:
+            data = base64.b64decode(encoded)
+        except Exception:
+            return jsonify({"status":"error","msg":"bad base64"}), 400
+        key, size = store.put_bytes(data, attempt_id) if data else (None, 0)
+    else:
+        key, size = store.put_stream(upload.stream if upload is not None else request.stream, attempt_id)
+    if not size:
         return jsonify({"status":"error","msg":"no image"}), 400
-    try:
-        header, encoded = imgdata.split(",", 1)
-    except Exception:
-        return jsonify({"status":"error","msg":"invalid image data"}), 400
-    try:
-        data = base64.b64decode(encoded)
-    except Exception:
-        return jsonify({"status":"error","msg":"bad base64"}), 400
-    # Save file (filename as uuid)
-    fname = f"{uuid.uuid4().hex}.jpg"
-    path = os.path.join(UPLOAD_IMG, fname)
-    # Ensure directory exists in case it was deleted while server is running
-    try:
-        os.makedirs(UPLOAD_IMG, exist_ok=True)
-    except Exception:
-        pass
-    with open(path, "wb") as f:
-        f.write(data)
-
-    # Validate attempt exists and write under lock
-    with db_lock:
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("SELECT id FROM attempts WHERE id=?", (attempt_id,))
-        if not cur.fetchone():
-            # attempt not found — still keep the file but report error
-            conn.close()
-            return jsonify({"status":"error","msg":"invalid attempt_id"}), 400
-
-        # insert image record with retry/backoff
-        max_retries = 5
-        for i in range(max_retries):
-            try:
-                cur.execute("INSERT INTO proctor_images (attempt_id, filename, timestamp) VALUES (?,?,?)",
-                            (attempt_id, fname, datetime.now(timezone.utc).isoformat()))
-                conn.commit()
-                break
-            except sqlite3.OperationalError as e:
-                if 'locked' in str(e).lower() and i < max_retries - 1:
-                    time.sleep(0.1 * (i + 1))
-                    continue
-                else:
-                    conn.close()
-                    raise
-        conn.close()
-
+    metrics.snapshots.inc()
+    metrics.snapshot_bytes.inc(size)
+
+    rng = store.pack_range(key)
+    stamp = datetime.now(timezone.utc).isoformat()
+    writer.submit(lambda cur: insert_snapshot(cur, attempt_id, key, stamp,
+                                              rng[1] if rng else None, rng[2] if rng else None))
+    ingest.submit(key, attempt_id)
     return jsonify({"status":"ok"})
 
 
 # ------------------ PROCTOR: LOG EVENT ------------------
+# One event {"attempt_id", "event", "detail"} or a client-buffered batch
+# {"attempt_id", "events": [{"event", "detail", "ts"}, ...]}. Rows go to the
+# writer's insert buffer, so events arriving within one commit window are
+# written with a single executemany.
+MAX_BATCH_EVENTS = 500
+# client timestamps outside this window (clock skew, replays) use server time
+EVENT_MAX_AGE = timedelta(minutes=15)
+EVENT_MAX_SKEW = timedelta(seconds=30)
+
+
+def _event_time(ts, now):
+    t = parse_iso_datetime(ts) if isinstance(ts, str) else None
+    if t is None or not (now - EVENT_MAX_AGE <= t <= now + EVENT_MAX_SKEW):
+        t = now
+    return t.isoformat()
+
+
 @app.route("/proctor/log_event", methods=["POST"])
 def proctor_log_event():
-    data = request.get_json()
+    data = request.get_json(force=True, silent=True) or {}
     attempt_id = data.get("attempt_id")
-    ev = data.get("event")
-    detail = data.get("detail", "")
-
-    # Validate attempt and write under lock with retries
-    with db_lock:
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("SELECT id FROM attempts WHERE id=?", (attempt_id,))
-        if not cur.fetchone():
-            conn.close(); return jsonify({"status":"error","msg":"invalid attempt_id"}), 400
-
-        max_retries = 5
-        for i in range(max_retries):
-            try:
-                cur.execute("INSERT INTO proctor_events (attempt_id, event_type, detail, timestamp) VALUES (?,?,?,?)",
-                            (attempt_id, ev, detail, datetime.now(timezone.utc).isoformat()))
-                conn.commit()
-                break
-            except sqlite3.OperationalError as e:
-                if 'locked' in str(e).lower() and i < max_retries - 1:
-                    time.sleep(0.1 * (i + 1))
-                    continue
-                else:
-                    conn.close()
-                    raise
-        conn.close()
-    return jsonify({"status":"ok"})
+    items = data.get("events")
+    if items is None:
+        items = [data]
+    if not isinstance(items, list) or len(items) > MAX_BATCH_EVENTS:
+        return jsonify({"status":"error","msg":"invalid events"}), 400
+
+    att = active_attempts.get(attempt_id)
+    if att is None:
+        return jsonify({"status":"error","msg":"invalid attempt_id"}), 400
+    denied = _write_denied(att)
+    if denied:
+        return denied
+    attempt_id = att.id
+
+    now = datetime.now(timezone.utc)
+    rows = [(attempt_id, item.get("event"), item.get("detail", ""), _event_time(item.get("ts"), now))
+            for item in items if isinstance(item, dict) and item.get("event")]
+    if rows:
+        writer.append(EVENT_INSERT_SQL, rows)
+    for row in rows:
+        hub.publish("admin", "proctor_event", {"attempt_id": attempt_id, "event": row[1]})
+    return jsonify({"status":"ok", "logged": len(rows)})
 
 # ------------------ SUBMIT EXAM (STUDENT) ------------------
 @app.route("/submit_exam", methods=["POST"])
 def submit_exam():
-    attempt_id = request.form.get("attempt_id")
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT * FROM attempts WHERE id=?", (attempt_id,))
-    att = cur.fetchone()
+    attempt_id = request.form.get("attempt_id", type=int)
+    att = get_attempt(attempt_id) if attempt_id is not None else None
     if not att:
-        conn.close(); flash("Attempt not found", "danger"); return redirect(url_for("student_dashboard"))
+        flash("Attempt not found", "danger"); return redirect(url_for("student_dashboard"))
     now = datetime.now(timezone.utc)
     allowed_until = parse_iso_datetime(att['allowed_until'])
     if allowed_until is None:
@@ -412,208 +677,267 @@ def submit_exam():
     else:
         time_exceeded = 1 if now > allowed_until else 0
 
-    cur.execute("SELECT e.max_questions FROM exams e WHERE e.id=?", (att['exam_id'],))
-    max_q_row = cur.fetchone()
-    max_q = max_q_row['max_questions'] if max_q_row else 50
-
-    cur.execute("SELECT q.id, q.correct FROM questions q WHERE q.exam_id=? ORDER BY q.q_index LIMIT ?",
-                (att['exam_id'], max_q))
-    qrows = cur.fetchall()
-    score = 0
-    total = len(qrows)
-    for q in qrows:
-        cur.execute("SELECT selected FROM answers WHERE attempt_id=? AND question_id= ?", (attempt_id, q['id']))
-        ans = cur.fetchone()
-        if ans and ans['selected'] and ans['selected'] == q['correct']:
-            score += 1
-    # Store percentage score (0-100)
-    percentage = round((score / total * 100), 1) if total > 0 else 0
-    # Perform update with retries to avoid transient 'database is locked'
-    max_retries = 5
-    for i in range(max_retries):
-        try:
-            cur.execute("UPDATE attempts SET score=?, end_time=?, submitted=1, time_exceeded=? WHERE id=?",
-                        (percentage, now.isoformat(), time_exceeded, attempt_id))
-            conn.commit()
-            break
-        except sqlite3.OperationalError as e:
-            if 'locked' in str(e).lower() and i < max_retries - 1:
-                time.sleep(0.2 * (i + 1))
-                continue
-            else:
-                conn.close()
-                raise
-    conn.close()
+    was_submitted, score = writer.submit(
+        lambda cur: finalize_attempt(cur, att['id'], now.isoformat(), time_exceeded), durable=True)
+    active_attempts.invalidate(att['id'])
+    sweeper.discard(att['id'])
+    if not was_submitted:
+        stats.attempt_submitted(att['user_id'], score)
+        hub.publish("admin", "attempt_submitted", {"attempt_id": att['id'], "score": score})
+        hub.publish(f"user:{att['user_id']}", "attempt_submitted")
     flash("Exam submitted. Results will be visible to admin only.", "success")
     return redirect(url_for("student_dashboard"))
 
+# ------------------ ADMIN: RE-GRADE EXAM ------------------
+@app.route("/admin/regrade/<int:exam_id>", methods=["POST"])
+def regrade_exam(exam_id):
+    if 'user_id' not in session or not session.get('is_admin'):
+        return redirect(url_for("admin_login"))
+    scores = writer.submit(lambda cur: grading.regrade_exam(cur, exam_id), durable=True)
+    stats.invalidate()
+    hub.publish("admin", "regraded", {"exam_id": exam_id, "attempts": len(scores)})
+    flash(f"Re-graded {len(scores)} attempt(s)", "success")
+    return redirect(url_for("admin_results", exam_id=exam_id))
+
 # ------------------ ADMIN: VIEW RESULTS ------------------
+# raw_score/total are materialized on attempts by grading, so this page is a
+# plain indexed read. Rows are ordered best score first (ungraded last), or
+# most suspicious first with sort=suspicion (scores from analysis.py), and
+# paged with a keyset cursor "<sort key>:<id>" instead of OFFSET.
+RESULTS_PAGE_SIZE = 100
+
 @app.route("/admin/results")
 def admin_results():
     if 'user_id' not in session or not session.get('is_admin'):
         return redirect(url_for("admin_login"))
-    conn = get_conn(); cur = conn.cursor()
-    # Optional: filter by exam id so each exam can have its own results view
+    # Optional filters: exam id so each exam can have its own results view,
+    # and a start date range (YYYY-MM-DD, inclusive)
     exam_id = request.args.get('exam_id')
-    if exam_id:
-        # when exam_id provided, filter attempts to that exam only
-        cur.execute("""
-        SELECT 
-            a.*,
-            u.username,
-            e.title as exam_title,
-            e.max_questions,
-            COUNT(DISTINCT CASE WHEN ans.selected = q.correct THEN ans.id END) as raw_score
-        FROM attempts a
-        LEFT JOIN users u ON u.id = a.user_id
-        LEFT JOIN exams e ON e.id = a.exam_id
-        LEFT JOIN answers ans ON ans.attempt_id = a.id
-        LEFT JOIN questions q ON q.id = ans.question_id
-        WHERE a.exam_id = ?
-        GROUP BY a.id, a.user_id, a.exam_id, a.start_time, a.end_time, a.submitted, 
-                a.score, a.time_exceeded, a.allowed_until, u.username, e.title, e.max_questions
-        ORDER BY (a.score IS NULL) ASC, a.score DESC, a.start_time DESC""", (exam_id,))
-    else:
-        # Get all attempts with additional data including raw scores
-        cur.execute("""
-        SELECT 
-            a.*,
-            u.username,
-            e.title as exam_title,
-            e.max_questions,
-            COUNT(DISTINCT CASE WHEN ans.selected = q.correct THEN ans.id END) as raw_score
-        FROM attempts a
-        LEFT JOIN users u ON u.id = a.user_id
-        LEFT JOIN exams e ON e.id = a.exam_id
-        LEFT JOIN answers ans ON ans.attempt_id = a.id
-        LEFT JOIN questions q ON q.id = ans.question_id
-        GROUP BY a.id, a.user_id, a.exam_id, a.start_time, a.end_time, a.submitted, 
-                a.score, a.time_exceeded, a.allowed_until, u.username, e.title, e.max_questions
-        ORDER BY (a.score IS NULL) ASC, a.score DESC, a.start_time DESC""")
-    attempts = cur.fetchall()
-    
+    date_from = request.args.get('from') or None
+    date_to = request.args.get('to') or None
+    per_page = min(500, max(1, request.args.get('per_page', RESULTS_PAGE_SIZE, type=int)))
+    rank_offset = max(0, request.args.get('rank', 0, type=int))
+    sort = 'suspicion' if request.args.get('sort') == 'suspicion' else 'score'
+    filters = {"exam_id": exam_id, "date_from": date_from, "date_to": date_to}
+
+    after = request.args.get('after')
+    if after:
+        try:
+            after_key, after_id = after.split(":", 1)
+            after = (float(after_key), int(after_id))
+        except ValueError:
+            abort(400)
+    attempts = results_page(sort=sort, after=after or None, limit=per_page + 1, **filters)
+    next_cursor = None
+    if len(attempts) > per_page:
+        attempts = attempts[:per_page]
+        last = attempts[-1]
+        sort_key = last[sort] if last[sort] is not None else -1
+        next_cursor = f"{sort_key}:{last['id']}"
+
+    # totals across all pages for the summary cards
+    summary = results_summary(**filters)
+
     # Prepare results list for grouped exam results
     results = []
     for a in attempts:
-        # sqlite3.Row doesn't implement .get(), use index access
-        submitted = a['submitted'] if 'submitted' in a.keys() else None
-        score = a['score'] if 'score' in a.keys() else None
-        if submitted and score is not None:
+        if a['submitted'] and a['score'] is not None:
             results.append({
-                'exam_name': a['exam_title'] if 'exam_title' in a.keys() else None,
-                'student_name': a['username'] if 'username' in a.keys() else None,
-                'score': score,
-                'raw_score': a['raw_score'] if 'raw_score' in a.keys() else None,
-                'total_questions': a['max_questions'] if 'max_questions' in a.keys() else None,
-                'timestamp': a['end_time'] if 'end_time' in a.keys() else None
+                'exam_name': a['exam_title'],
+                'student_name': a['username'],
+                'score': a['score'],
+                'raw_score': a['raw_score'],
+                'total_questions': a['total'],
+                'timestamp': a['end_time']
             })
-    
+
     # If exam_id provided, fetch exam title for nicer heading
     exam_title = None
     if exam_id:
-        try:
-            exam_conn = get_conn()
-            exam_cur = exam_conn.cursor()
-            exam_cur.execute("SELECT title FROM exams WHERE id=?", (exam_id,))
-            row = exam_cur.fetchone()
-            if row:
-                # sqlite3.Row supports indexing by column name
-                exam_title = row['title'] if 'title' in row.keys() else row[0]
-            exam_conn.close()
-        except Exception:
-            exam_title = None
-    conn.close()
-    return render_template("admin_results.html", attempts=attempts, results=results, exam_title=exam_title)
+        row = get_exam(exam_id)
+        exam_title = row['title'] if row else None
+
+    next_url = None
+    if next_cursor:
+        next_url = url_for("admin_results", exam_id=exam_id, per_page=per_page, after=next_cursor,
+                           rank=rank_offset + len(attempts), sort=None if sort == 'score' else sort,
+                           **{k: v for k, v in (("from", date_from), ("to", date_to)) if v})
+    return render_template("admin_results.html", attempts=attempts, results=results, exam_title=exam_title,
+                           exam_id=exam_id, summary=summary, next_url=next_url, rank_offset=rank_offset,
+                           date_from=date_from, date_to=date_to, sort=sort)
 
 # ------------------ ADMIN: VIEW ATTEMPT DETAIL ------------------
 @app.route("/admin/attempt/<int:attempt_id>")
 def admin_attempt_detail(attempt_id):
     if 'user_id' not in session or not session.get('is_admin'):
         return redirect(url_for("admin_login"))
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("""SELECT a.*, u.username AS username, e.title AS exam_title
-                   FROM attempts a
-                   LEFT JOIN users u ON u.id=a.user_id
-                   LEFT JOIN exams e ON e.id=a.exam_id
-                   WHERE a.id=?""", (attempt_id,))
-    att = cur.fetchone()
-    if not att:
-        conn.close(); abort(404)
-    cur.execute("SELECT * FROM proctor_images WHERE attempt_id=? ORDER BY timestamp", (attempt_id,))
-    images = cur.fetchall()
-    cur.execute("SELECT * FROM proctor_events WHERE attempt_id=? ORDER BY timestamp", (attempt_id,))
-    events = cur.fetchall()
-    cur.execute("""SELECT q.q_index, q.question, q.option_a, q.option_b, q.option_c, q.option_d, q.correct, a.selected
-                   FROM questions q
-                   LEFT JOIN answers a ON q.id=a.question_id AND a.attempt_id=?
-                   WHERE q.exam_id = ? ORDER BY q.q_index""", (attempt_id, att['exam_id']))
-    q_and_a = cur.fetchall()
-    conn.close()
+    detail = attempt_detail(attempt_id)
+    if detail is None:
+        abort(404)
+    att, images, events, q_and_a = detail
     return render_template("admin_attempt.html", att=att, images=images, events=events, q_and_a=q_and_a)
 
 # ------------------ SERVE UPLOADS ------------------
+# Snapshot keys never change content (content hash, pack byte range or uuid),
+# so responses are cacheable forever with a strong ETag derived from the key.
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+
+def _cache_forever(resp, etag):
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = f"private, max-age={IMAGE_MAX_AGE}, immutable"
+    return resp
+
+
 @app.route("/uploads/proctor_images/<path:fname>")
 def serve_image(fname):
-    return send_from_directory(UPLOAD_IMG, fname)
+    # fname is the store key recorded in proctor_images (or a legacy flat name)
+    etag = hashlib.sha1(fname.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        return _cache_forever(Response(status=304), etag)
+
+    # packed snapshots are sliced straight out of the attempt's mapped pack file
+    rng = store.pack_range(fname)
+    if rng:
+        try:
+            data = store.read_range(*rng)
+        except (FileNotFoundError, ValueError):
+            abort(404)
+        resp = _cache_forever(Response(data, mimetype="image/jpeg"), etag)
+        resp.headers['Accept-Ranges'] = "bytes"
+        return resp.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+    if app.config['IMAGE_SENDFILE'] == "x-accel":
+        path = safe_join(store.root, fname)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        resp = Response(mimetype="image/jpeg")
+        resp.headers['X-Accel-Redirect'] = app.config['IMAGE_ACCEL_PREFIX'] + fname
+        return _cache_forever(resp, etag)
+
+    # plain send (or X-Sendfile when USE_X_SENDFILE is on); handles Range itself
+    resp = send_from_directory(store.root, fname, etag=etag, max_age=IMAGE_MAX_AGE, conditional=True)
+    return _cache_forever(resp, etag)
+
+
+# ------------------ ADMIN: DOWNLOAD ALL SNAPSHOTS ------------------
+# Streams a zip (stored, JPEGs do not compress) of every snapshot of an
+# attempt. Rows are read in storage order so a pack is read front to back.
+class _ZipStream:
+    """Write-only sink for zipfile that hands out what was written so far."""
+
+    def __init__(self):
+        self._buf = []
+        self._pos = 0
+
+    def write(self, data):
+        self._buf.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out, self._buf = b"".join(self._buf), []
+        return out
+
+
+@app.route("/admin/attempt/<int:attempt_id>/snapshots.zip")
+def download_snapshots(attempt_id):
+    if 'user_id' not in session or not session.get('is_admin'):
+        return redirect(url_for("admin_login"))
+    rows = attempt_snapshots(attempt_id)
+    if not rows:
+        abort(404)
+
+    def generate():
+        sink = _ZipStream()
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+            for row in rows:
+                try:
+                    data = store.read(row['filename'])
+                except (OSError, ValueError):
+                    continue
+                stamp = (row['timestamp'] or "").replace(":", "-")
+                zf.writestr(f"{row['id']:06d}_{stamp}.jpg", data)
+                yield sink.drain()
+        yield sink.drain()
+
+    return Response(generate(), mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename=attempt_{attempt_id}_snapshots.zip"})
 
 
 # ------------------ API: Admin Stats ------------------
+# Both stats endpoints answer from the in-memory StatsCache and carry an ETag,
+# so pollers whose numbers have not changed get an empty 304.
+def _conditional_json(payload):
+    resp = jsonify(payload)
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+
 @app.route("/api/admin/stats")
 def api_admin_stats():
     if 'user_id' not in session or not session.get('is_admin'):
         return jsonify({"error":"unauthorized"}), 401
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) as c FROM exams")
-    exams_count = cur.fetchone()[0] if cur.fetchone is None else cur.execute("SELECT COUNT(*) FROM exams").fetchone()[0]
-    # Re-execute safely to fetch counts
-    cur.execute("SELECT COUNT(*) FROM exams"); exams_count = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM attempts"); attempts_count = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM attempts WHERE submitted=1"); submitted_count = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM attempts WHERE submitted=0"); active_attempts = cur.fetchone()[0]
-    cur.execute("""
-        SELECT AVG(score) 
-        FROM attempts 
-        WHERE score IS NOT NULL 
-        AND submitted=1
-    """); 
-    avg = cur.fetchone()[0]
-    avg_score = round(avg, 1) if avg is not None else None
-    conn.close()
-    return jsonify({
-        "exams": exams_count,
-        "attempts": attempts_count,
-        "submitted": submitted_count,
-        "active_attempts": active_attempts,
-        "avg_score": avg_score
-    })
+    return _conditional_json(stats.admin())
 
 # ------------------ API: Student Stats ------------------
 @app.route("/api/student/stats")
 def api_student_stats():
     if 'user_id' not in session or session.get('is_admin'):
         return jsonify({"error":"unauthorized"}), 401
-    uid = session['user_id']
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM attempts"); total_exams = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM attempts WHERE user_id=?", (uid,)); attempts_count = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM attempts WHERE user_id=? AND submitted=0", (uid,)); pending_count = cur.fetchone()[0]
-    cur.execute("""
-        SELECT AVG(score) 
-        FROM attempts 
-        WHERE user_id=? 
-        AND score IS NOT NULL 
-        AND submitted=1
-    """, (uid,))
-    avg = cur.fetchone()[0]
-    avg_score = round(avg, 1) if avg is not None else None
-    conn.close()
-    return jsonify({
-        "total_exams": total_exams,
-        "attempts": attempts_count,
-        "pending": pending_count,
-        "avg_score": avg_score
-    })
+    return _conditional_json(stats.student(session['user_id']))
+
+# ------------------ API: Live Stream (SSE) ------------------
+# One long-lived response per open dashboard. Stats are pushed only when they
+# change; admins also get attempt/submission/proctor notifications.
+STREAM_HEARTBEAT_SECS = 15
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/api/stream")
+def api_stream():
+    if 'user_id' not in session:
+        return jsonify({"error":"unauthorized"}), 401
+    if session.get('is_admin'):
+        sub = hub.subscribe("admin")
+        snapshot = stats.admin
+    else:
+        uid = session['user_id']
+        sub = hub.subscribe("students", f"user:{uid}")
+        snapshot = lambda: stats.student(uid)
+
+    def generate():
+        last = None
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                current = snapshot()
+                if current != last:
+                    last = current
+                    yield _sse("stats", current)
+                msg = sub.get(timeout=STREAM_HEARTBEAT_SECS)
+                if msg is None:
+                    yield ": ping\n\n"
+                    continue
+                topic, event, data = msg
+                if data is not None:
+                    yield _sse(event, data)
+        finally:
+            sub.close()
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
+    # development server; for production run server.py (pre-fork workers)
     app.run(debug=True)
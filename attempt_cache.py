@@ -0,0 +1,91 @@
+# attempt_cache.py
+"""
+In-memory cache of active attempts for the hot write endpoints.
+
+save_answer(s), proctor_upload_image and proctor_log_event run many times
+per attempt, while what they validate against (owner, exam, deadline,
+served question ids) is fixed when the attempt starts. start_exam puts the
+attempt here, submit_exam drops it and edit_exam drops every attempt of the
+edited exam; misses (another process started it, evicted, restart) load it
+from the database. Entries are re-read after a short TTL so a submit made by
+another process is noticed.
+"""
+import os
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+import models
+import selection
+
+ATTEMPT_CACHE_SIZE = int(os.environ.get("ATTEMPT_CACHE_SIZE", 10000))
+ATTEMPT_CACHE_TTL = float(os.environ.get("ATTEMPT_CACHE_TTL", 30))
+
+ActiveAttempt = namedtuple("ActiveAttempt", "id user_id exam_id allowed_until submitted question_ids")
+
+
+class AttemptCache:
+    def __init__(self, connect, parse_time, size=ATTEMPT_CACHE_SIZE, ttl=ATTEMPT_CACHE_TTL):
+        self._connect = connect
+        self._parse_time = parse_time
+        self.size = size
+        self.ttl = ttl
+        self._lock = Lock()
+        # attempt_id -> (loaded_at, ActiveAttempt)
+        self._entries = OrderedDict()
+
+    def get(self, attempt_id):
+        """ActiveAttempt for an id (int or numeric string), or None if there is no such attempt."""
+        try:
+            attempt_id = int(attempt_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            hit = self._entries.get(attempt_id)
+            if hit is not None and time.monotonic() - hit[0] <= self.ttl:
+                self._entries.move_to_end(attempt_id)
+                return hit[1]
+        att = self._load(attempt_id)
+        if att is not None:
+            self._store(att)
+        return att
+
+    def put(self, attempt_id, user_id, exam_id, allowed_until, question_ids):
+        """Record an attempt that was just started."""
+        self._store(ActiveAttempt(int(attempt_id), user_id, exam_id, allowed_until, 0, frozenset(question_ids)))
+
+    def invalidate(self, attempt_id):
+        with self._lock:
+            self._entries.pop(int(attempt_id), None)
+
+    def invalidate_exam(self, exam_id):
+        """Drop every cached attempt of an exam (its questions changed)."""
+        with self._lock:
+            for aid in [aid for aid, (_, a) in self._entries.items() if a.exam_id == exam_id]:
+                del self._entries[aid]
+
+    def _store(self, att):
+        with self._lock:
+            self._entries[att.id] = (time.monotonic(), att)
+            self._entries.move_to_end(att.id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _load(self, attempt_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("""
+                SELECT a.id, a.user_id, a.exam_id, a.allowed_until, a.submitted, a.question_ids, e.max_questions
+                FROM attempts a LEFT JOIN exams e ON e.id = a.exam_id
+                WHERE a.id=?""", (attempt_id,)).fetchone()
+            if row is None:
+                return None
+            if row['question_ids'] is not None:
+                qids = selection.unpack(row['question_ids'])
+            else:
+                qids = [r['id'] for r in conn.execute(
+                    "SELECT id FROM questions WHERE exam_id=? ORDER BY q_index LIMIT ?",
+                    (row['exam_id'], row['max_questions'] if row['max_questions'] is not None else models.backend.NO_LIMIT))]
+        finally:
+            conn.close()
+        return ActiveAttempt(row['id'], row['user_id'], row['exam_id'], self._parse_time(row['allowed_until']),
+                             row['submitted'] or 0, frozenset(qids))
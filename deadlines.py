@@ -0,0 +1,162 @@
+# deadlines.py
+"""
+Server-side exam deadlines.
+
+The browser's timer submits the exam when time runs out, but a closed tab
+never does and the attempt would stay open forever. DeadlineSweeper keeps a
+min-heap of allowed_until for open attempts (start_exam schedules new ones;
+open attempts are re-read from the database at start and every
+RESCAN_SECS, which also picks up attempts started by other processes) and a
+background thread closes every attempt ANSWER_GRACE_SECS past its deadline:
+graded, submitted=1, time_exceeded=1, end_time=allowed_until. Expired
+attempts are closed SWEEP_BATCH at a time in one writer intent, so a cohort
+that runs out of time together costs a few transactions instead of one
+submit per student. The open rows are locked before grading (one writer at
+a time on SQLite, FOR UPDATE on PostgreSQL), so an attempt submitted or
+swept by another process meanwhile is neither graded nor reported twice.
+"""
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+import models
+import grading
+
+log = logging.getLogger(__name__)
+
+# attempts closed per writer intent
+SWEEP_BATCH = int(os.environ.get("SWEEP_BATCH", 200))
+# how often open attempts are re-read from the database
+RESCAN_SECS = float(os.environ.get("SWEEP_RESCAN_SECS", 60))
+
+_CLOSE_SQL = """
+UPDATE attempts SET submitted=1, time_exceeded=1, end_time=allowed_until
+WHERE id=? AND submitted=0
+"""
+
+
+class DeadlineSweeper:
+    def __init__(self, connect, writer, parse_time, grace_secs=0, on_closed=None,
+                 batch=SWEEP_BATCH, rescan_secs=RESCAN_SECS):
+        """on_closed(rows) gets [(attempt_id, user_id, score)] after each committed batch."""
+        self._connect = connect
+        self._writer = writer
+        self._parse_time = parse_time
+        self.grace = grace_secs
+        self.batch = batch
+        self.rescan_secs = rescan_secs
+        self._on_closed = on_closed
+        self._cond = threading.Condition()
+        # (due timestamp, attempt_id); entries whose id is no longer in _due are stale
+        self._heap = []
+        self._due = {}
+        self._thread = None
+        self._pid = None
+
+    # ---- scheduling ----
+    def schedule(self, attempt_id, allowed_until):
+        """Close the attempt grace seconds after allowed_until (an aware datetime) unless submitted first."""
+        if allowed_until is None:
+            return
+        due = allowed_until.timestamp() + self.grace
+        with self._cond:
+            self._push(int(attempt_id), due)
+            if self._heap[0][1] == int(attempt_id):
+                self._cond.notify()
+        self.ensure_started()
+
+    def discard(self, attempt_id):
+        """The attempt was submitted; forget its deadline."""
+        with self._cond:
+            self._due.pop(int(attempt_id), None)
+
+    def pending(self):
+        with self._cond:
+            return len(self._due)
+
+    def _push(self, attempt_id, due):
+        if self._due.get(attempt_id) == due:
+            return
+        self._due[attempt_id] = due
+        heapq.heappush(self._heap, (due, attempt_id))
+
+    def _pop_expired(self, now):
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            due, attempt_id = heapq.heappop(self._heap)
+            if self._due.get(attempt_id) == due:
+                del self._due[attempt_id]
+                expired.append(attempt_id)
+        return expired
+
+    # ---- thread ----
+    def ensure_started(self):
+        # restart after fork: threads do not survive into child processes
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="deadline-sweeper", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        next_scan = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_scan:
+                    self.rescan()
+                    next_scan = time.monotonic() + self.rescan_secs
+                self.sweep()
+            except Exception:
+                log.exception("deadline sweep failed")
+            with self._cond:
+                wait = next_scan - time.monotonic()
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - time.time())
+                if wait > 0:
+                    self._cond.wait(wait)
+
+    # ---- work ----
+    def rescan(self):
+        """Schedule every open attempt in the database (cheap: partial index on submitted=0)."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT id, allowed_until FROM attempts WHERE submitted=0").fetchall()
+        finally:
+            conn.close()
+        with self._cond:
+            for r in rows:
+                until = self._parse_time(r['allowed_until'])
+                # unparseable deadlines are already over as far as submit_exam is concerned
+                self._push(r['id'], until.timestamp() + self.grace if until is not None else 0.0)
+
+    def sweep(self, now=None):
+        """Close every attempt whose deadline (plus grace) has passed. Returns how many were closed."""
+        with self._cond:
+            expired = self._pop_expired(time.time() if now is None else now)
+        closed = 0
+        for i in range(0, len(expired), self.batch):
+            rows = self._writer.submit(lambda cur, ids=expired[i:i + self.batch]: close_attempts(cur, ids),
+                                       durable=True)
+            closed += len(rows)
+            if rows and self._on_closed is not None:
+                self._on_closed(rows)
+        return closed
+
+
+def close_attempts(cur, attempt_ids):
+    """Grade and close the still-open attempts among attempt_ids; returns [(attempt_id, user_id, score)]."""
+    # rows closed by a concurrent transaction drop out once it commits; id
+    # order keeps two sweeps from deadlocking
+    cur.execute(f"SELECT id, user_id FROM attempts WHERE id IN (SELECT value FROM {models.backend.ids} AS p)"
+                f" AND submitted=0 ORDER BY id{models.backend.for_update}",
+                (json.dumps([int(a) for a in attempt_ids]),))
+    open_rows = cur.fetchall()
+    if not open_rows:
+        return []
+    scores = grading.grade_attempts(cur, [r['id'] for r in open_rows])
+    cur.executemany(_CLOSE_SQL, [(r['id'],) for r in open_rows])
+    return [(r['id'], r['user_id'], grading.percentage(*scores[r['id']])) for r in open_rows]
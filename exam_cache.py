@@ -0,0 +1,94 @@
+# exam_cache.py
+"""
+Compiled exam payloads for start_exam.
+
+A cohort starts the same exam within the same minute, so the exam row, its
+served questions and the rendered question markup are built once per exam
+version and reused; start_exam then only inserts the attempt. exams.version
+is bumped by edit_exam; this process drops its entry right away and other
+processes notice the new version the next time they re-check (VERSION_TTL).
+
+Randomized exams (see selection.py) keep their whole question bank grouped
+by pool instead of fixed markup; start_exam draws and renders per attempt.
+"""
+import os
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+import models
+import selection
+
+EXAM_CACHE_SIZE = int(os.environ.get("EXAM_CACHE_SIZE", 256))
+VERSION_TTL = float(os.environ.get("EXAM_VERSION_TTL", 5))
+
+# questions/question_ids/questions_html are the served set of a fixed exam;
+# pools and by_id hold the full bank of a randomized one
+ExamPayload = namedtuple("ExamPayload", "exam version questions question_ids questions_html pools by_id")
+
+
+class ExamCache:
+    def __init__(self, connect, render, size=EXAM_CACHE_SIZE, ttl=VERSION_TTL):
+        """render(exam, questions) returns the question markup for an exam."""
+        self._connect = connect
+        self._render = render
+        self.size = size
+        self.ttl = ttl
+        self._lock = Lock()
+        # exam_id -> (checked_at, ExamPayload)
+        self._entries = OrderedDict()
+
+    def get(self, exam_id):
+        """ExamPayload for the exam's current version, or None if it does not exist."""
+        with self._lock:
+            hit = self._entries.get(exam_id)
+            if hit is not None:
+                self._entries.move_to_end(exam_id)
+        if hit is not None:
+            if time.monotonic() - hit[0] <= self.ttl:
+                return hit[1]
+            if self._current_version(exam_id) == hit[1].version:
+                self._store(hit[1])
+                return hit[1]
+        payload = self._load(exam_id)
+        if payload is not None:
+            self._store(payload)
+        else:
+            self.invalidate(exam_id)
+        return payload
+
+    def invalidate(self, exam_id):
+        with self._lock:
+            self._entries.pop(exam_id, None)
+
+    def _store(self, payload):
+        with self._lock:
+            self._entries[payload.exam['id']] = (time.monotonic(), payload)
+            self._entries.move_to_end(payload.exam['id'])
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _current_version(self, exam_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT version FROM exams WHERE id=?", (exam_id,)).fetchone()
+        finally:
+            conn.close()
+        return row['version'] if row else None
+
+    def _load(self, exam_id):
+        conn = self._connect()
+        try:
+            exam = conn.execute("SELECT * FROM exams WHERE id=?", (exam_id,)).fetchone()
+            if exam is None:
+                return None
+            questions = conn.execute("SELECT * FROM questions WHERE exam_id=? ORDER BY q_index LIMIT ?",
+                                     (exam_id, models.backend.NO_LIMIT if exam['randomize'] else exam['max_questions'])).fetchall()
+        finally:
+            conn.close()
+        exam = dict(exam)
+        questions = [dict(q) for q in questions]
+        if exam['randomize']:
+            return ExamPayload(exam, exam['version'], questions, (), None,
+                               selection.group_pools(questions), {q['id']: q for q in questions})
+        return ExamPayload(exam, exam['version'], questions, tuple(q['id'] for q in questions),
+                           self._render(exam, questions), None, None)
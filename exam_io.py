@@ -0,0 +1,187 @@
+# exam_io.py
+"""
+Exam question import/export and id-preserving question updates.
+
+Questions arrive as JSON ({"title", "duration_minutes", "max_questions",
+"questions": [...]}) or CSV (one question per row, exam settings passed
+separately) and are validated in full before anything is written. An
+optional "pool" field/column labels the question's pool for randomized
+exams (see selection.py).
+
+save_questions() diffs the new question list against the stored one instead
+of deleting and re-inserting: identical questions keep their id (even if
+they moved), edited questions are updated in place at their position, and
+only the rest is inserted or deleted, each with one executemany. Answers
+therefore stay attached to unchanged questions. A question answered in a
+submitted attempt is never deleted (the save is refused), so a regrade
+scores graded attempts over the questions they actually answered.
+"""
+import io
+import csv
+import json
+import models
+
+FIELDS = ("question", "option_a", "option_b", "option_c", "option_d", "correct")
+# columns that may be left out of an import
+OPTIONAL_FIELDS = ("pool",)
+COLUMNS = FIELDS + OPTIONAL_FIELDS
+CHOICES = ("A", "B", "C", "D")
+# stop collecting after this many problems; the import is rejected either way
+MAX_ERRORS = 20
+
+
+class ExamFormatError(ValueError):
+    """Raised with a list of human readable problems when an import is invalid."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _clean(value):
+    return value.strip() if isinstance(value, str) else ("" if value is None else str(value))
+
+
+def validate_questions(items):
+    """
+    Normalize an iterable of question dicts (FIELDS keys, optional q_index)
+    into a list of dicts with q_index 1..n in the given order. Raises
+    ExamFormatError listing what is wrong.
+    """
+    questions, errors = [], []
+    for n, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            errors.append(f"question {n}: expected an object")
+        else:
+            q = {f: _clean(item.get(f)) for f in FIELDS}
+            q['correct'] = q['correct'].upper()
+            q['pool'] = _clean(item.get('pool')) or None
+            if not q['question']:
+                errors.append(f"question {n}: question text is required")
+            elif q['correct'] not in CHOICES:
+                errors.append(f"question {n}: correct must be one of A, B, C, D")
+            elif not q[f"option_{q['correct'].lower()}"]:
+                errors.append(f"question {n}: option {q['correct']} (the correct answer) is empty")
+            q['q_index'] = n
+            questions.append(q)
+        if len(errors) >= MAX_ERRORS:
+            errors.append("too many errors, stopped checking")
+            break
+    if errors:
+        raise ExamFormatError(errors)
+    return questions
+
+
+def parse_json(stream):
+    """Exam settings and validated questions from a JSON document."""
+    try:
+        doc = json.load(io.TextIOWrapper(stream, encoding="utf-8-sig"))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ExamFormatError([f"invalid JSON: {e}"])
+    if isinstance(doc, list):
+        doc = {"questions": doc}
+    if not isinstance(doc, dict) or not isinstance(doc.get("questions"), list):
+        raise ExamFormatError(['expected {"questions": [...]} or a list of questions'])
+    settings = {k: doc[k] for k in ("title", "duration_minutes", "max_questions", "randomize")
+                if doc.get(k) is not None}
+    return settings, validate_questions(doc["questions"])
+
+
+def parse_csv(stream):
+    """Validated questions from a CSV stream with a header row naming FIELDS (pool optional)."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    missing = [f for f in FIELDS if f not in (reader.fieldnames or ())]
+    if missing:
+        raise ExamFormatError([f"missing CSV column(s): {', '.join(missing)}"])
+    try:
+        return validate_questions(reader)
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ExamFormatError([f"invalid CSV: {e}"])
+
+
+def export_json(exam, questions):
+    """Yield a JSON document for an exam chunk by chunk (questions is any iterable of rows)."""
+    head = {k: exam[k] for k in ("title", "duration_minutes", "max_questions")}
+    head['randomize'] = bool(exam['randomize'])
+    yield json.dumps(head)[:-1] + ', "questions": ['
+    sep = ""
+    for q in questions:
+        yield sep + json.dumps({f: q[f] for f in COLUMNS})
+        sep = ", "
+    yield "]}\n"
+
+
+def export_csv(questions):
+    """Yield CSV text (header first) for any iterable of question rows."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    for n, q in enumerate(questions, start=1):
+        writer.writerow([q[f] for f in COLUMNS])
+        if n % 500 == 0:
+            yield buf.getvalue()
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+
+def save_questions(cur, exam_id, questions):
+    """
+    Make the exam's questions equal to `questions` (validated dicts with
+    q_index), keeping ids wherever possible. Answers of open attempts to
+    removed questions are deleted with them; removing a question that a
+    submitted attempt answered raises ExamFormatError. Returns counts of
+    kept/moved/updated/inserted/deleted.
+    """
+    cur.execute(f"SELECT id, q_index, {', '.join(COLUMNS)} FROM questions WHERE exam_id=? ORDER BY q_index, id",
+                (exam_id,))
+    existing = cur.fetchall()
+    by_content = {}
+    for row in existing:
+        by_content.setdefault(tuple(row[f] for f in COLUMNS), []).append(row)
+
+    matched, moved, unmatched = set(), [], []
+    for q in questions:
+        rows = by_content.get(tuple(q.get(f) for f in COLUMNS))
+        if rows:
+            row = rows.pop(0)
+            matched.add(row['id'])
+            if row['q_index'] != q['q_index']:
+                moved.append((q['q_index'], row['id']))
+        else:
+            unmatched.append(q)
+
+    # edited questions: reuse the leftover row that sat at the same position
+    free = {}
+    for row in existing:
+        if row['id'] not in matched:
+            free.setdefault(row['q_index'], []).append(row)
+    updated, inserted = [], []
+    for q in unmatched:
+        rows = free.get(q['q_index'])
+        if rows:
+            updated.append((*(q.get(f) for f in COLUMNS), q['q_index'], rows.pop(0)['id']))
+        else:
+            inserted.append((exam_id, q['q_index'], *(q.get(f) for f in COLUMNS)))
+    deleted = [(row['id'],) for rows in free.values() for row in rows]
+
+    if deleted:
+        cur.execute(f"""SELECT DISTINCT q.q_index FROM questions q
+                        JOIN answers a ON a.question_id = q.id
+                        JOIN attempts t ON t.id = a.attempt_id AND t.submitted=1
+                        WHERE q.id IN (SELECT value FROM {models.backend.ids} AS p)
+                        ORDER BY q.q_index""", (json.dumps([d[0] for d in deleted]),))
+        graded = [r[0] for r in cur.fetchall()]
+        if graded:
+            raise ExamFormatError([f"question {n} has answers in submitted attempts and cannot be removed"
+                                   for n in graded[:MAX_ERRORS]])
+        cur.executemany("DELETE FROM answers WHERE question_id=?", deleted)
+        cur.executemany("DELETE FROM questions WHERE id=?", deleted)
+    if moved:
+        cur.executemany("UPDATE questions SET q_index=? WHERE id=?", moved)
+    if updated:
+        cur.executemany(f"UPDATE questions SET {', '.join(f + '=?' for f in COLUMNS)}, q_index=? WHERE id=?", updated)
+    if inserted:
+        cur.executemany(f"""INSERT INTO questions (exam_id, q_index, {', '.join(COLUMNS)})
+                            VALUES (?, ?, {', '.join('?' * len(COLUMNS))})""", inserted)
+    return {"kept": len(matched) - len(moved), "moved": len(moved), "updated": len(updated),
+            "inserted": len(inserted), "deleted": len(deleted)}
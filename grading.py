@@ -0,0 +1,122 @@
+# grading.py
+"""
+Set-based grading.
+
+An attempt is graded against the questions it was served: its stored
+assignment (attempts.question_ids, see selection.py), or for attempts
+started before assignments existed the first max_questions questions of its
+exam (by q_index). Scores for any number of attempts come from one
+aggregate query per kind, and each answer's correctness is stored on
+answers.is_correct so reports can read it instead of re-joining against the
+answer key.
+
+All functions take a cursor so callers decide the transaction (the writer
+thread for submit_exam, a plain connection for maintenance scripts).
+"""
+import json
+import models
+import selection
+
+# fallback when an attempt's exam row is gone (matches the exams default)
+DEFAULT_MAX_QUESTIONS = 50
+
+_SCORE_SQL = """
+WITH picked AS (
+    SELECT value AS attempt_id FROM {ids} AS p0
+),
+qs AS (
+    SELECT q.id, q.exam_id, q.correct,
+           ROW_NUMBER() OVER (PARTITION BY q.exam_id ORDER BY q.q_index) AS rn
+    FROM questions q
+    WHERE q.exam_id IN (SELECT t.exam_id FROM attempts t JOIN picked p ON p.attempt_id = t.id)
+)
+SELECT t.id AS attempt_id,
+       COUNT(qs.id) AS total,
+       COALESCE(SUM(CASE WHEN a.selected IS NOT NULL AND a.selected = qs.correct THEN 1 ELSE 0 END), 0) AS raw_score
+FROM attempts t
+JOIN picked p ON p.attempt_id = t.id
+LEFT JOIN exams e ON e.id = t.exam_id
+LEFT JOIN qs ON qs.exam_id = t.exam_id AND qs.rn <= COALESCE(e.max_questions, ?)
+LEFT JOIN answers a ON a.attempt_id = t.id AND a.question_id = qs.id
+GROUP BY t.id
+"""
+
+
+_ASSIGNED_SCORE_SQL = """
+WITH assigned AS (
+    SELECT a AS attempt_id, b AS question_id FROM {pairs} AS s0
+)
+SELECT s.attempt_id,
+       COUNT(q.id) AS total,
+       COALESCE(SUM(CASE WHEN a.selected IS NOT NULL AND a.selected = q.correct THEN 1 ELSE 0 END), 0) AS raw_score
+FROM assigned s
+LEFT JOIN questions q ON q.id = s.question_id
+LEFT JOIN answers a ON a.attempt_id = s.attempt_id AND a.question_id = q.id
+GROUP BY s.attempt_id
+"""
+
+
+def percentage(raw_score, total):
+    # Store percentage score (0-100)
+    return round((raw_score / total * 100), 1) if total > 0 else 0
+
+
+def score_by_exam_order(cur, attempt_ids):
+    """Scores against the first max_questions questions of each attempt's exam (no assignment)."""
+    ids = [int(a) for a in attempt_ids]
+    if not ids:
+        return {}
+    cur.execute(_SCORE_SQL.format(ids=models.backend.ids), (json.dumps(ids), DEFAULT_MAX_QUESTIONS))
+    return {r['attempt_id']: (r['raw_score'], r['total']) for r in cur.fetchall()}
+
+
+def score_attempts(cur, attempt_ids):
+    """Return {attempt_id: (raw_score, total)} for the given attempts."""
+    ids = [int(a) for a in attempt_ids]
+    if not ids:
+        return {}
+    cur.execute(f"SELECT id, question_ids FROM attempts WHERE id IN (SELECT value FROM {models.backend.ids} AS p)",
+                (json.dumps(ids),))
+    legacy, pairs, assigned = [], [], []
+    for r in cur.fetchall():
+        if r['question_ids'] is None:
+            legacy.append(r['id'])
+        else:
+            assigned.append(r['id'])
+            pairs.extend([r['id'], qid] for qid in selection.unpack(r['question_ids']))
+    scores = score_by_exam_order(cur, legacy)
+    if assigned:
+        scores.update({aid: (0, 0) for aid in assigned})
+        cur.execute(_ASSIGNED_SCORE_SQL.format(pairs=models.backend.pairs), (json.dumps(pairs),))
+        scores.update({r['attempt_id']: (r['raw_score'], r['total']) for r in cur.fetchall()})
+    return scores
+
+
+def record_correctness(cur, attempt_ids):
+    """Store per-question correctness on the attempts' answer rows."""
+    ids = [int(a) for a in attempt_ids]
+    if not ids:
+        return
+    cur.execute(f"""
+        UPDATE answers SET is_correct = COALESCE(
+            (SELECT CASE WHEN answers.selected IS NOT NULL AND answers.selected = q.correct THEN 1 ELSE 0 END
+             FROM questions q WHERE q.id = answers.question_id), 0)
+        WHERE attempt_id IN (SELECT value FROM {models.backend.ids} AS p)""", (json.dumps(ids),))
+
+
+def grade_attempts(cur, attempt_ids):
+    """
+    Score attempts, record per-question correctness and store score (percent),
+    raw_score and total on attempts. Returns {attempt_id: (raw_score, total)}.
+    """
+    scores = score_attempts(cur, attempt_ids)
+    record_correctness(cur, scores.keys())
+    cur.executemany("UPDATE attempts SET score=?, raw_score=?, total=? WHERE id=?",
+                    [(percentage(raw, total), raw, total, aid) for aid, (raw, total) in scores.items()])
+    return scores
+
+
+def regrade_exam(cur, exam_id):
+    """Re-grade every submitted attempt of an exam (e.g. after an answer key fix)."""
+    cur.execute("SELECT id FROM attempts WHERE exam_id=? AND submitted=1", (exam_id,))
+    return grade_attempts(cur, [r['id'] for r in cur.fetchall()])
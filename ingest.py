@@ -0,0 +1,134 @@
+# ingest.py
+"""
+Background processing for uploaded proctor snapshots.
+
+proctor_upload_image only writes the bytes and queues the file here. A small
+worker pool then validates the JPEG with Pillow, writes a thumbnail for the
+admin attempt page and records dimensions/size on the proctor_images row.
+
+Frames that are near-identical to the attempt's previous frame (idle webcam)
+are re-pointed at that frame's file; the unreferenced copy is removed later
+by scripts/gc_snapshots.py. Both the dHash (structure) and a tiny colour
+thumbnail (brightness, colour) must match, so a lighting change or covered
+camera is never folded away. Pack storage keeps every frame's own range.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from storage import dhash, hamming, tiny_rgb, pixel_diff
+
+log = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+THUMB_DIR = "thumbs"
+THUMB_SIZE = (160, 120)
+THUMB_QUALITY = 70
+# max differing dHash bits for two frames to count as the same picture (<0 disables)
+NEAR_DUP_BITS = int(os.environ.get("NEAR_DUP_BITS", 4))
+# max mean per-pixel colour difference (0-255) for the same picture
+NEAR_DUP_MAX_DIFF = float(os.environ.get("NEAR_DUP_MAX_DIFF", 6))
+# attempts whose last frame fingerprint is kept in memory
+LAST_FRAME_CACHE = 10000
+
+
+class ImageIngest:
+    def __init__(self, store, writer, workers=INGEST_WORKERS):
+        self.store = store
+        self.upload_dir = store.root
+        self._writer = writer
+        self.workers = workers
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        # attempt_id -> (dhash, key, thumb, width, height, tiny_rgb) of its last kept frame
+        self._last = OrderedDict()
+
+    def submit(self, fname, attempt_id):
+        fut = self._executor().submit(self._process, fname, attempt_id)
+        with self._lock:
+            self._pending.add(fut)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def drain(self, timeout=None):
+        """Wait for every queued job (used on shutdown and by tooling)."""
+        with self._lock:
+            pending = list(self._pending)
+        for fut in pending:
+            fut.result(timeout)
+        self._writer.flush()
+
+    def thumb_name(self, fname):
+        return f"{THUMB_DIR}/{fname}"
+
+    def _done(self, fut):
+        with self._lock:
+            self._pending.discard(fut)
+
+    def _executor(self):
+        # worker threads do not survive a fork; recreate the pool per process
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="img-ingest")
+        return self._pool
+
+    def _remember(self, attempt_id, frame):
+        with self._lock:
+            self._last[attempt_id] = frame
+            self._last.move_to_end(attempt_id)
+            while len(self._last) > LAST_FRAME_CACHE:
+                self._last.popitem(last=False)
+
+    def _previous(self, attempt_id):
+        with self._lock:
+            return self._last.get(attempt_id)
+
+    def _process(self, fname, attempt_id):
+        width = height = thumb = phash = size = None
+        key, near_dup = fname, 0
+        status = "ok"
+        try:
+            size = self.store.size(fname)
+            with self.store.open(fname) as fh, Image.open(fh) as im:
+                im.verify()
+            with self.store.open(fname) as fh, Image.open(fh) as im:
+                if im.format != "JPEG":
+                    raise ValueError(f"unexpected format {im.format}")
+                width, height = im.size
+                # let libjpeg downscale while decoding instead of decoding full size
+                im.draft("RGB", THUMB_SIZE)
+                im = im.convert("RGB")
+                phash, colours = dhash(im), tiny_rgb(im)
+                prev = self._previous(attempt_id)
+                if (prev and self.store.shares_frames and NEAR_DUP_BITS >= 0 and prev[1] != fname
+                        and hamming(prev[0], phash) <= NEAR_DUP_BITS
+                        and pixel_diff(prev[5], colours) <= NEAR_DUP_MAX_DIFF):
+                    # same picture as the last kept frame: reference that file instead
+                    _, key, thumb, width, height, _ = prev
+                    near_dup = 1
+                else:
+                    thumb = self.thumb_name(fname)
+                    thumb_path = os.path.join(self.upload_dir, thumb)
+                    # content-addressed: an identical upload already has its thumbnail
+                    if not os.path.exists(thumb_path):
+                        im.thumbnail(THUMB_SIZE)
+                        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                        im.save(thumb_path, "JPEG", quality=THUMB_QUALITY, optimize=True)
+                    self._remember(attempt_id, (phash, fname, thumb, width, height, colours))
+        except FileNotFoundError:
+            log.warning("snapshot %s disappeared before ingest", fname)
+            return
+        except Exception as e:
+            log.warning("snapshot %s failed validation: %s", fname, e)
+            status, width, height, thumb = "invalid", None, None, None
+        self._writer.execute(
+            """UPDATE proctor_images SET filename=?, width=?, height=?, size_bytes=?, thumb=?, status=?,
+                      phash=?, near_dup=?
+               WHERE filename=? AND attempt_id=?""",
+            (key, width, height, size, thumb, status, phash, near_dup, fname, attempt_id))
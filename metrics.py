@@ -0,0 +1,313 @@
+# metrics.py
+"""
+Request and SQL instrumentation, exposed in Prometheus text format at /metrics.
+
+SQLite connections opened by models use InstrumentedConnection (the
+PostgreSQL backend mixes TimedCursor/TimedTransactions into its psycopg2
+classes), whose cursors time every statement: per-statement durations by kind, statement
+count and time per request, how long BEGIN waited for SQLite's write lock
+and how long the transaction held it, and "database is locked" errors.
+init_app() adds Flask hooks for per-endpoint request counts and latency.
+The writer thread reports batch sizes and lock retries, the upload route
+snapshot bytes.
+
+Statements slower than SLOW_QUERY_MS (0 disables) are logged to the
+"slow_query" logger, and to SLOW_QUERY_LOG if that names a file. Values are
+per process.
+"""
+import os
+import time
+import bisect
+import logging
+import sqlite3
+import threading
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+# optional bearer token required by /metrics
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 0))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+slow_log = logging.getLogger("slow_query")
+
+
+# ---- Metric types ----
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    esc = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, esc)) + "}"
+
+
+def _fmt_value(v):
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [bucket counts..., sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, **labels):
+        row = self._values.get(tuple(labels.get(n, "") for n in self.labels))
+        return row[-1] if row else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for le, n in zip(self.buckets, row):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, [('le', _fmt_value(le))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, [('le', '+Inf')])} {row[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(row[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {row[-1]}")
+        return lines
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        """fn() returns the current value when /metrics is scraped."""
+        self.name, self.help, self.fn = name, help, fn
+
+    def render(self):
+        try:
+            return [f"{self.name} {_fmt_value(self.fn())}"]
+        except Exception:
+            return []
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn):
+        return self.add(Gauge(name, help, fn))
+
+    def render(self):
+        out = []
+        for m in self._metrics:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(m.render())
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests = REGISTRY.counter("http_requests_total", "Requests by endpoint, method and status.",
+                                 ("endpoint", "method", "status"))
+http_latency = REGISTRY.histogram("http_request_duration_seconds", "Time to response (first byte when streamed).",
+                                  ("endpoint",))
+request_queries = REGISTRY.histogram("db_queries_per_request", "SQL statements run by one request.",
+                                     ("endpoint",), COUNT_BUCKETS)
+request_query_time = REGISTRY.histogram("db_query_seconds_per_request", "Time one request spent in SQL.",
+                                        ("endpoint",))
+query_latency = REGISTRY.histogram("db_query_duration_seconds", "SQL statement duration by kind.", ("op",))
+lock_wait = REGISTRY.histogram("db_lock_wait_seconds", "Time BEGIN waited for the database write lock.")
+lock_hold = REGISTRY.histogram("db_lock_hold_seconds", "Time an explicit transaction held the write lock.")
+write_lock_wait = REGISTRY.histogram("db_write_lock_wait_seconds",
+                                     "Time a write transaction waited for the cross-process write lock.")
+lock_errors = REGISTRY.counter("db_locked_errors_total", 'Statements that failed with "database is locked".')
+write_retries = REGISTRY.counter("db_write_retries_total", "Writer batches retried after a lock error.")
+writer_batch = REGISTRY.histogram("writer_batch_size", "Write intents committed per writer transaction.",
+                                  buckets=SIZE_BUCKETS)
+snapshot_bytes = REGISTRY.counter("snapshot_bytes_total", "Bytes of proctor snapshots received.")
+snapshots = REGISTRY.counter("snapshots_total", "Proctor snapshots received.")
+
+
+# ---- SQL instrumentation ----
+_local = threading.local()
+
+
+def _op(sql):
+    word = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK",
+                            "SAVEPOINT", "RELEASE", "PRAGMA", "CREATE", "ALTER", "DROP") else "OTHER"
+
+
+def record_query(conn, sql, started, failed=None):
+    """Account one statement on conn that began at perf_counter() `started`."""
+    elapsed = time.perf_counter() - started
+    op = _op(sql)
+    query_latency.observe(elapsed, op=op)
+    req = getattr(_local, "request", None)
+    if req is not None:
+        req[0] += 1
+        req[1] += elapsed
+    if op == "BEGIN":
+        lock_wait.observe(elapsed)
+        if failed is None:
+            conn._txn_started = time.perf_counter()
+    elif sql.strip().upper() in ("COMMIT", "ROLLBACK", "END"):
+        conn._end_txn()
+    if failed is not None and "locked" in str(failed).lower():
+        lock_errors.inc()
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_log.warning("%.1f ms [%s] %s", elapsed * 1000, getattr(_local, "endpoint", None) or
+                         threading.current_thread().name, " ".join(sql.split())[:1000])
+
+
+class TimedCursor:
+    """Cursor mixin timing execute/executemany; mix in before the driver's cursor class."""
+
+    def execute(self, sql, parameters=()):
+        if not METRICS_ENABLED:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except Exception as e:
+            record_query(self.connection, sql, started, e)
+            raise
+        record_query(self.connection, sql, started)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        if not METRICS_ENABLED:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+        except Exception as e:
+            record_query(self.connection, sql, started, e)
+            raise
+        record_query(self.connection, sql, started)
+        return result
+
+
+class TimedTransactions:
+    """Connection mixin closing the lock-hold timer on commit/rollback."""
+    _txn_started = None
+
+    def commit(self):
+        super().commit()
+        self._end_txn()
+
+    def rollback(self):
+        super().rollback()
+        self._end_txn()
+
+    def _end_txn(self):
+        if self._txn_started is not None:
+            lock_hold.observe(time.perf_counter() - self._txn_started)
+            self._txn_started = None
+
+
+class InstrumentedCursor(TimedCursor, sqlite3.Cursor):
+    pass
+
+
+class InstrumentedConnection(TimedTransactions, sqlite3.Connection):
+    """sqlite3 connection factory whose cursors (and execute shortcuts) are timed."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ---- Flask integration ----
+def init_app(app):
+    from flask import request, Response, abort
+    if not METRICS_ENABLED:
+        return
+
+    if SLOW_QUERY_LOG:
+        handler = logging.FileHandler(SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_log.addHandler(handler)
+        slow_log.setLevel(logging.WARNING)
+
+    @app.before_request
+    def _start_timer():
+        _local.request = [0, 0.0, time.perf_counter()]
+        _local.endpoint = request.endpoint or "unmatched"
+
+    @app.after_request
+    def _record_request(response):
+        req, _local.request = getattr(_local, "request", None), None
+        if req is not None:
+            endpoint = _local.endpoint
+            http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+            http_latency.observe(time.perf_counter() - req[2], endpoint=endpoint)
+            request_queries.observe(req[0], endpoint=endpoint)
+            request_query_time.observe(req[1], endpoint=endpoint)
+        return response
+
+    @app.teardown_request
+    def _record_failure(exc=None):
+        # after_request does not run when a view raised
+        req, _local.request = getattr(_local, "request", None), None
+        if req is not None:
+            http_requests.inc(endpoint=_local.endpoint, method=request.method, status=500)
+            http_latency.observe(time.perf_counter() - req[2], endpoint=_local.endpoint)
+        _local.endpoint = None
+
+    @app.route("/metrics")
+    def metrics():
+        if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            abort(403)
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,161 @@
+# pubsub.py
+"""
+Tiny in-process publish/subscribe hub feeding the /api/stream SSE endpoint.
+
+Write paths publish small notifications to topics ("admin", "students",
+"user:<id>"); each open stream holds a bounded queue. A slow client only
+loses notifications, never blocks the publisher, and the next stats push
+brings it back in sync anyway.
+
+Under a pre-fork server a stream and the write it waits for are usually
+handled by different workers. With a Relay every published notification is
+also sent to the other workers of the same server as a unix datagram
+(one socket per worker in a shared directory) and delivered there to local
+subscribers. Delivery stays best-effort in the same way.
+"""
+import os
+import json
+import queue
+import socket
+import logging
+from threading import Lock, Thread
+
+log = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    def __init__(self, hub, topics):
+        self._hub = hub
+        self.topics = tuple(topics)
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def get(self, timeout=None):
+        """Next (topic, event, data) tuple, or None on timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+
+class Relay:
+    """Fan notifications out to sibling worker processes through unix datagram sockets in `directory`."""
+    MAX_DATAGRAM = 60000
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._sock = None
+        self._path = None
+        self._pid = None
+        self._lock = Lock()
+
+    def ensure_started(self, deliver):
+        """Bind this process's socket and start its receiver thread (again after fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # the parent's socket belongs to the parent; only our own file is removed at exit
+            self._path = os.path.join(self.directory, f"{self._pid}.sock")
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(self._path)
+            Thread(target=self._receive, args=(self._sock, deliver), name="pubsub-relay", daemon=True).start()
+
+    def send(self, topic, event, data):
+        if self._pid != os.getpid():
+            return
+        payload = json.dumps([topic, event, data], default=str).encode()
+        if len(payload) > self.MAX_DATAGRAM:
+            log.warning("notification %s/%s too large to relay", topic, event)
+            return
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".sock") or path == self._path:
+                continue
+            try:
+                self._sock.sendto(payload, path)
+            except OSError:
+                # worker gone or its buffer is full: best-effort like local delivery
+                pass
+
+    def close(self):
+        if self._pid == os.getpid() and self._sock is not None:
+            self._sock.close()
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            self._pid = None
+
+    @staticmethod
+    def _receive(sock, deliver):
+        while True:
+            try:
+                payload = sock.recv(Relay.MAX_DATAGRAM + 1)
+            except OSError:
+                return
+            try:
+                topic, event, data = json.loads(payload)
+            except ValueError:
+                continue
+            deliver(topic, event, data)
+
+
+class PubSub:
+    def __init__(self, relay=None):
+        """relay: optional Relay connecting the workers of a pre-fork server."""
+        self._lock = Lock()
+        self._subs = {}
+        self.relay = relay
+
+    def start(self):
+        """Start receiving relayed notifications in this process."""
+        if self.relay is not None:
+            self.relay.ensure_started(self._deliver)
+
+    def subscribe(self, *topics):
+        self.start()
+        sub = Subscription(self, topics)
+        with self._lock:
+            for t in sub.topics:
+                self._subs.setdefault(t, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for t in sub.topics:
+                subs = self._subs.get(t)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[t]
+
+    def publish(self, topic, event, data=None):
+        if self.relay is not None:
+            self.relay.send(topic, event, data)
+        self._deliver(topic, event, data)
+
+    def _deliver(self, topic, event, data):
+        with self._lock:
+            subs = list(self._subs.get(topic, ()))
+        for sub in subs:
+            try:
+                sub.queue.put_nowait((topic, event, data))
+            except queue.Full:
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subs in self._subs.values() for s in subs})
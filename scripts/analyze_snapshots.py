@@ -0,0 +1,41 @@
+import os
+import sys
+
+# Resolve paths relative to repo root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(ROOT_DIR, "exam.db")
+UPLOAD_DIR = os.path.join(ROOT_DIR, "uploads", "proctor_images")
+
+sys.path.insert(0, ROOT_DIR)
+import models  # noqa: E402
+from analysis import analyze_pending, ANALYSIS_WORKERS  # noqa: E402
+
+# snapshots scored per round; each round is one process-pool run and one transaction
+ROUND_SIZE = 10000
+
+
+def analyze_snapshots(db_path: str, upload_dir: str, workers: int = ANALYSIS_WORKERS) -> int:
+    """Score every validated snapshot that has no frame_scores row yet (db_path may be a DATABASE_URL)."""
+    if "://" not in db_path and not os.path.exists(db_path):
+        print(f"Database file not found: {db_path}")
+        return 0
+    models.configure(db_path)
+    conn = models.get_conn()
+    total = 0
+    try:
+        while True:
+            done = analyze_pending(conn, upload_dir, workers=workers, limit=ROUND_SIZE)
+            if not done:
+                break
+            total += done
+            print(f"  scored {total} snapshot(s)")
+    finally:
+        conn.close()
+    return total
+
+
+if __name__ == "__main__":
+    db = models.DATABASE_URL or DB_PATH
+    print(f"Using database: {db}")
+    scored = analyze_snapshots(db, UPLOAD_DIR)
+    print(f"Scored {scored} snapshot(s)")
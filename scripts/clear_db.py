@@ -8,6 +8,8 @@ DB_PATH = os.path.join(ROOT_DIR, "exam.db")
 TABLES_DELETE_ORDER = [
     # children first
     "answers",
+    "frame_scores",
+    "attempt_suspicion",
     "proctor_images",
     "proctor_events",
     "attempts",
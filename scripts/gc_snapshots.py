@@ -0,0 +1,35 @@
+import os
+import sys
+
+# Resolve paths relative to repo root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(ROOT_DIR, "exam.db")
+UPLOAD_DIR = os.path.join(ROOT_DIR, "uploads", "proctor_images")
+
+sys.path.insert(0, ROOT_DIR)
+import models  # noqa: E402
+from storage import SnapshotStore  # noqa: E402
+
+# keep recently written files: their proctor_images row may still be queued
+GRACE_SECS = 3600
+
+
+def gc_snapshots(db_path: str, upload_dir: str, grace_secs: int = GRACE_SECS) -> int:
+    """Remove stored snapshots no proctor_images row points at (e.g. folded near-duplicates)."""
+    if "://" not in db_path and not os.path.exists(db_path):
+        print(f"Database file not found: {db_path}")
+        return 0
+    models.configure(db_path)
+    conn = models.get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT DISTINCT filename FROM proctor_images WHERE filename IS NOT NULL")
+    referenced = {r[0] for r in cur.fetchall()}
+    conn.close()
+    return SnapshotStore(upload_dir).gc(referenced, grace_secs=grace_secs)
+
+
+if __name__ == "__main__":
+    db = models.DATABASE_URL or DB_PATH
+    print(f"Using database: {db}")
+    removed = gc_snapshots(db, UPLOAD_DIR)
+    print(f"Removed {removed} unreferenced snapshot file(s)")
@@ -0,0 +1,348 @@
+"""
+Synthetic exam-day cohort against the app, in-process through Flask's test
+client and/or over HTTP against a real WSGI server (werkzeug's threaded one
+started here, or any running deployment via --url). Every student logs in,
+starts the same exam, answers questions at random times, uploads a webcam
+frame every --snapshot-secs, sends focus/blur events in batches like
+proctor.js, and then the whole cohort submits at the same moment.
+
+Reported per endpoint: requests, errors, throughput, p50/p90/p99/max
+latency. A probe thread meanwhile times how long a BEGIN IMMEDIATE waits for
+SQLite's write lock, and (in-process) samples the writer queue depth.
+
+  python scripts/loadtest.py --students 100 --exam-secs 60
+  python scripts/seed_db.py --db /tmp/big.db --students 5000
+  python scripts/loadtest.py --db /tmp/big.db --mode server --students 300
+  python scripts/loadtest.py --url http://127.0.0.1:5000 --db exam.db --students 200
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+from io import BytesIO
+from datetime import datetime, timezone
+
+# Resolve paths relative to repo root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from PIL import Image  # noqa: E402
+import seed_db  # noqa: E402
+
+ATTEMPT_RE = re.compile(rb'name="attempt_id" value="(\d+)"')
+QID_RE = re.compile(rb'data-qid="(\d+)"')
+# how often buffered proctor events are sent (matches EVENT_FLUSH_MS in proctor.js)
+EVENT_FLUSH_SECS = 2.0
+
+
+# ---- Measurements ----
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.errors = {}
+
+    def add(self, name, seconds, ok=True):
+        with self._lock:
+            self.latency.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def _pct(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))]
+
+
+def summarize(rec, wall):
+    rows = []
+    for name, values in sorted(rec.latency.items()):
+        v = sorted(values)
+        rows.append({"endpoint": name, "requests": len(v), "errors": rec.errors.get(name, 0),
+                     "rps": round(len(v) / wall, 1) if wall else 0.0,
+                     "p50_ms": round(_pct(v, 50) * 1000, 1), "p90_ms": round(_pct(v, 90) * 1000, 1),
+                     "p99_ms": round(_pct(v, 99) * 1000, 1), "max_ms": round(v[-1] * 1000, 1)})
+    return rows
+
+
+def print_table(title, rows, extra):
+    print(f"\n== {title} ==")
+    print(f"{'endpoint':<28}{'reqs':>7}{'errs':>6}{'req/s':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for r in rows:
+        print(f"{r['endpoint']:<28}{r['requests']:>7}{r['errors']:>6}{r['rps']:>8}"
+              f"{r['p50_ms']:>9}{r['p90_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+    for key, value in extra.items():
+        print(f"{key}: {value}")
+
+
+class LockProbe(threading.Thread):
+    """Times BEGIN IMMEDIATE on its own connection; optionally samples a queue depth."""
+
+    def __init__(self, db_path, rec, interval=0.2, depth=None):
+        super().__init__(name="lock-probe", daemon=True)
+        self.db_path = db_path
+        self.rec = rec
+        self.interval = interval
+        self.depth = depth
+        self.depths = []
+        self._done = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        try:
+            while not self._done.wait(self.interval):
+                t0 = time.perf_counter()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    self.rec.add("sqlite write lock (probe)", time.perf_counter() - t0)
+                    conn.execute("ROLLBACK")
+                except sqlite3.OperationalError:
+                    self.rec.add("sqlite write lock (probe)", time.perf_counter() - t0, ok=False)
+                if self.depth is not None:
+                    self.depths.append(self.depth())
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+# ---- Clients ----
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, json_body=None, content_type=None):
+        resp = self.client.open(path, method=method, data=data, json=json_body, content_type=content_type)
+        return resp.status_code, resp.get_data()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    def __init__(self, base_url):
+        self.base = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None, json_body=None, content_type=None):
+        headers = {}
+        if json_body is not None:
+            data, content_type = json.dumps(json_body).encode(), "application/json"
+        elif isinstance(data, dict):
+            data = urllib.parse.urlencode(data).encode()
+            content_type = "application/x-www-form-urlencoded"
+        if content_type:
+            headers["Content-Type"] = content_type
+        req = urllib.request.Request(self.base + path, data=data, method=method, headers=headers)
+        try:
+            with self.opener.open(req, timeout=120) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+# ---- Cohort ----
+def make_frames(rng, count=16):
+    """Noisy 320x240 JPEGs (about the size of proctor.js frames) that do not fold as near-duplicates."""
+    frames = []
+    for _ in range(count):
+        im = Image.effect_noise((320, 240), rng.uniform(40, 90)).convert("RGB")
+        buf = BytesIO()
+        im.save(buf, "JPEG", quality=60)
+        frames.append(buf.getvalue())
+    return frames
+
+
+def _call(rec, session, name, method, path, ok=(200,), **kw):
+    t0 = time.perf_counter()
+    try:
+        status, body = session.request(method, path, **kw)
+    except Exception:
+        rec.add(name, time.perf_counter() - t0, ok=False)
+        return None, b""
+    rec.add(name, time.perf_counter() - t0, ok=status in ok)
+    return status, body
+
+
+def run_student(session, username, exam_id, cfg, rng, frames, barrier, rec):
+    _call(rec, session, "POST /login", "POST", "/login", ok=(302,),
+          data={"username": username, "password": seed_db.SEED_PASSWORD})
+    status, body = _call(rec, session, "GET /start_exam", "GET", f"/start_exam/{exam_id}")
+    m = ATTEMPT_RE.search(body or b"")
+    if status != 200 or m is None:
+        # still take part in the synchronized submit so the others are not held up
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        return
+    attempt_id = int(m.group(1))
+    qids = [int(q) for q in QID_RE.findall(body)]
+
+    # timeline of this student's exam, in seconds from start
+    plan = [(rng.uniform(0, cfg.exam_secs), "answer", q) for q in qids]
+    plan += [(rng.uniform(0, cfg.exam_secs), "answer", rng.choice(qids)) for _ in range(len(qids) // 4)] if qids else []
+    plan += [(t, "snapshot", None) for t in _ticks(rng.uniform(0, cfg.snapshot_secs), cfg.snapshot_secs, cfg.exam_secs)]
+    for _ in range(int(cfg.blur_per_min * cfg.exam_secs / 60)):
+        t = rng.uniform(0, cfg.exam_secs)
+        plan += [(t, "event", "window_blur"), (t + rng.uniform(0.5, 5), "event", "window_focus")]
+    plan.sort(key=lambda p: p[0])
+
+    start = time.monotonic()
+    pending, last_flush, frame = [], start, rng.randrange(len(frames))
+    for at, kind, arg in plan:
+        delay = start + at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if kind == "answer":
+            _call(rec, session, "POST /save_answer", "POST", "/save_answer",
+                  json_body={"attempt_id": attempt_id, "question_id": arg, "selected": rng.choice("ABCD")})
+        elif kind == "snapshot":
+            frame = (frame + 1) % len(frames)
+            _call(rec, session, "POST /proctor/upload_image", "POST",
+                  f"/proctor/upload_image?attempt_id={attempt_id}", data=frames[frame], content_type="image/jpeg")
+        else:
+            pending.append({"event": arg, "detail": "", "ts": datetime.now(timezone.utc).isoformat()})
+        if pending and time.monotonic() - last_flush >= EVENT_FLUSH_SECS:
+            _call(rec, session, "POST /proctor/log_event", "POST", "/proctor/log_event",
+                  json_body={"attempt_id": attempt_id, "events": pending})
+            pending, last_flush = [], time.monotonic()
+    if pending:
+        _call(rec, session, "POST /proctor/log_event", "POST", "/proctor/log_event",
+              json_body={"attempt_id": attempt_id, "events": pending})
+
+    # the whole cohort's timer runs out together
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    _call(rec, session, "POST /submit_exam", "POST", "/submit_exam", ok=(302,),
+          data={"attempt_id": str(attempt_id)})
+
+
+def _ticks(first, every, until):
+    t = first
+    while t < until:
+        yield t
+        t += every
+
+
+def run_cohort(make_session, usernames, exam_id, cfg, probe_db, depth=None):
+    rec = Recorder()
+    rng = random.Random(cfg.seed)
+    frames = make_frames(rng)
+    barrier = threading.Barrier(len(usernames))
+    probe = LockProbe(probe_db, rec, depth=depth)
+    threads = []
+    for n, name in enumerate(usernames):
+        srng = random.Random(rng.random())
+        t = threading.Thread(target=run_student, name=f"student-{n}",
+                             args=(make_session(), name, exam_id, cfg, srng, frames, barrier, rec))
+        threads.append((cfg.ramp_secs * n / max(1, len(usernames)), t))
+    probe.start()
+    t0 = time.monotonic()
+    for at, t in threads:
+        delay = t0 + at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        t.start()
+    for _, t in threads:
+        t.join()
+    wall = time.monotonic() - t0
+    probe.stop()
+    extra = {"students": len(usernames), "wall seconds": round(wall, 1)}
+    if probe.depths:
+        extra["writer queue depth (avg/max)"] = f"{sum(probe.depths) / len(probe.depths):.1f}/{max(probe.depths)}"
+    return summarize(rec, wall), extra
+
+
+def _prepare(db_path, cfg, title):
+    conn = seed_db.connect(db_path)
+    try:
+        rng = random.Random(cfg.seed)
+        seed_db.seed_students(conn, cfg.students, prefix=cfg.prefix)
+        exam_id = seed_db.seed_exam(conn, rng, title, cfg.questions, cfg.max_questions,
+                                    duration=max(1, int(cfg.exam_secs // 60) + 5))
+    finally:
+        conn.close()
+    return [f"{cfg.prefix}{n}" for n in range(1, cfg.students + 1)], exam_id
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Exam-day load test: synthetic cohort, per-endpoint latency.")
+    p.add_argument("--mode", choices=("client", "server", "both"), default="both",
+                   help="in-process test client, werkzeug threaded server, or both in turn")
+    p.add_argument("--url", help="benchmark an already running server instead (needs --db)")
+    p.add_argument("--db", help="database file (default: a fresh one in a temporary directory)")
+    p.add_argument("--students", type=int, default=50)
+    p.add_argument("--prefix", default="student", help="username prefix of the (seeded) students")
+    p.add_argument("--questions", type=int, default=40)
+    p.add_argument("--max-questions", type=int, default=20)
+    p.add_argument("--exam-secs", type=float, default=60, help="how long each student stays in the exam")
+    p.add_argument("--snapshot-secs", type=float, default=15)
+    p.add_argument("--blur-per-min", type=float, default=2, help="focus/blur pairs per student per minute")
+    p.add_argument("--ramp-secs", type=float, default=5, help="spread logins over this many seconds")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--json", help="also write the results to this file")
+    cfg = p.parse_args(argv)
+
+    results = {}
+    if cfg.url:
+        if not cfg.db:
+            p.error("--url needs --db (the server's database file) to create the cohort and probe locks")
+        users, exam_id = _prepare(os.path.abspath(cfg.db), cfg, "Load test")
+        rows, extra = run_cohort(lambda: HttpSession(cfg.url), users, exam_id, cfg, cfg.db)
+        print_table(f"HTTP {cfg.url}", rows, extra)
+        results["url"] = {"endpoints": rows, **extra}
+    else:
+        # the app resolves uploads/ against the working directory
+        workdir = os.path.dirname(os.path.abspath(cfg.db)) if cfg.db else tempfile.mkdtemp(prefix="loadtest-")
+        os.chdir(workdir)
+        db_path = os.path.abspath(cfg.db or "exam.db")
+        import models
+        models.configure(db_path)
+        print(f"Working directory: {workdir}")
+        import app as appmod
+        depth = appmod.writer.depth
+        if cfg.mode in ("client", "both"):
+            users, exam_id = _prepare(db_path, cfg, "Load test (test client)")
+            rows, extra = run_cohort(lambda: TestClientSession(appmod.app), users, exam_id, cfg, db_path, depth)
+            print_table("Flask test client", rows, extra)
+            results["client"] = {"endpoints": rows, **extra}
+        if cfg.mode in ("server", "both"):
+            from werkzeug.serving import make_server
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+            server = make_server("127.0.0.1", 0, appmod.app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base = f"http://127.0.0.1:{server.server_port}"
+            try:
+                users, exam_id = _prepare(db_path, cfg, "Load test (server)")
+                rows, extra = run_cohort(lambda: HttpSession(base), users, exam_id, cfg, db_path, depth)
+            finally:
+                server.shutdown()
+            print_table(f"werkzeug threaded server {base}", rows, extra)
+            results["server"] = {"endpoints": rows, **extra}
+    if cfg.json:
+        with open(cfg.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import sys
+import random
+import argparse
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+# Resolve paths relative to repo root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(ROOT_DIR, "exam.db")
+UPLOAD_DIR = os.path.join(ROOT_DIR, "uploads", "proctor_images")
+
+sys.path.insert(0, ROOT_DIR)
+from PIL import Image  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+import models  # noqa: E402
+import grading  # noqa: E402
+import selection  # noqa: E402
+from storage import SnapshotStore  # noqa: E402
+
+# every seeded student logs in with this password
+SEED_PASSWORD = "bench-pass"
+EVENT_TYPES = ("window_blur", "window_focus", "tab_hidden", "tab_visible", "frames_skipped")
+# rows per executemany/commit
+CHUNK = 5000
+
+
+def connect(db_path):
+    """Connection to db_path with the app's schema (created/migrated if needed)."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    models.configure(db_path)
+    models.init_db()
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    return conn
+
+
+def _chunked(cur, sql, rows):
+    for i in range(0, len(rows), CHUNK):
+        cur.executemany(sql, rows[i:i + CHUNK])
+        cur.connection.commit()
+
+
+def seed_students(conn, count, prefix="student"):
+    """Create prefix1..prefixN (skipping existing names); returns their ids in order."""
+    pwd_hash = generate_password_hash(SEED_PASSWORD)
+    cur = conn.cursor()
+    names = [f"{prefix}{n}" for n in range(1, count + 1)]
+    _chunked(cur, "INSERT OR IGNORE INTO users (username, password_hash, is_admin) VALUES (?,?,0)",
+             [(name, pwd_hash) for name in names])
+    ids = {}
+    for i in range(0, len(names), 500):
+        part = names[i:i + 500]
+        cur.execute(f"SELECT id, username FROM users WHERE username IN ({','.join('?' * len(part))})", part)
+        ids.update((r['username'], r['id']) for r in cur.fetchall())
+    return [ids[name] for name in names]
+
+
+def seed_exam(conn, rng, title, questions=40, max_questions=20, duration=60, pools=4, randomize=0):
+    """One exam with `questions` questions spread over `pools` pools; returns its id."""
+    cur = conn.cursor()
+    cur.execute("INSERT INTO exams (title, duration_minutes, max_questions, randomize) VALUES (?,?,?,?)",
+                (title, duration, max_questions, randomize))
+    exam_id = cur.lastrowid
+    cur.executemany("""INSERT INTO questions (exam_id, q_index, question, option_a, option_b, option_c, option_d,
+                                              correct, pool) VALUES (?,?,?,?,?,?,?,?,?)""",
+                    [(exam_id, i, f"{title}: question {i}?", f"A{i}", f"B{i}", f"C{i}", f"D{i}",
+                      rng.choice("ABCD"), f"pool{i % pools + 1}" if pools > 1 else None)
+                     for i in range(1, questions + 1)])
+    conn.commit()
+    return exam_id
+
+
+def _frames(upload_dir, rng, count=8):
+    """Store a few small distinct JPEG frames; seeded snapshots all point at these."""
+    store = SnapshotStore(upload_dir)
+    keys = []
+    for _ in range(count):
+        buf = BytesIO()
+        Image.new("RGB", (320, 240), tuple(rng.randrange(256) for _ in range(3))).save(buf, "JPEG")
+        keys.append((store.put_bytes(buf.getvalue())[0], len(buf.getvalue())))
+    return keys
+
+
+def seed_history(conn, rng, student_ids, exam_ids, attempts_per_student=3, events_per_attempt=20,
+                 images_per_attempt=40, upload_dir=UPLOAD_DIR, days=180):
+    """Submitted, graded attempts with answers, proctor events and snapshots spread over the past `days`."""
+    cur = conn.cursor()
+    cur.execute("SELECT id, duration_minutes, max_questions FROM exams WHERE id IN (%s)"
+                % ",".join("?" * len(exam_ids)), exam_ids)
+    exams = {r['id']: r for r in cur.fetchall()}
+    served = {}
+    for exam_id, e in exams.items():
+        cur.execute("SELECT id, correct FROM questions WHERE exam_id=? ORDER BY q_index LIMIT ?",
+                    (exam_id, e['max_questions']))
+        served[exam_id] = cur.fetchall()
+    frames = _frames(upload_dir, rng) if images_per_attempt else []
+    now = datetime.now(timezone.utc)
+
+    attempt_ids = []
+    for i in range(0, len(student_ids), 200):
+        answers, events, images = [], [], []
+        for user_id in student_ids[i:i + 200]:
+            for _ in range(attempts_per_student):
+                exam_id = rng.choice(exam_ids)
+                e, qs = exams[exam_id], served[exam_id]
+                start = now - timedelta(days=rng.uniform(1, days))
+                allowed = start + timedelta(minutes=e['duration_minutes'])
+                end = start + timedelta(minutes=rng.uniform(0.3, 1.0) * e['duration_minutes'])
+                cur.execute("""INSERT INTO attempts (user_id, exam_id, start_time, allowed_until, end_time,
+                                                     submitted, time_exceeded, question_ids)
+                               VALUES (?,?,?,?,?,1,0,?)""",
+                            (user_id, exam_id, start.isoformat(), allowed.isoformat(), end.isoformat(),
+                             selection.pack(q['id'] for q in qs)))
+                aid = cur.lastrowid
+                attempt_ids.append(aid)
+                skill = rng.random()
+                for q in qs:
+                    if rng.random() < 0.9:
+                        pick = q['correct'] if rng.random() < skill else rng.choice("ABCD")
+                        answers.append((aid, q['id'], pick))
+                span = (end - start).total_seconds()
+                for _ in range(events_per_attempt):
+                    t = start + timedelta(seconds=rng.uniform(0, span))
+                    events.append((aid, rng.choice(EVENT_TYPES), "", t.isoformat()))
+                for n in range(images_per_attempt):
+                    key, size = rng.choice(frames)
+                    t = start + timedelta(seconds=15 * n)
+                    images.append((aid, key, t.isoformat(), 320, 240, size, "ok"))
+        _chunked(cur, "INSERT INTO answers (attempt_id, question_id, selected) VALUES (?,?,?)", answers)
+        _chunked(cur, "INSERT INTO proctor_events (attempt_id, event_type, detail, timestamp) VALUES (?,?,?,?)",
+                 events)
+        _chunked(cur, """INSERT INTO proctor_images (attempt_id, filename, timestamp, width, height, size_bytes, status)
+                         VALUES (?,?,?,?,?,?,?)""", images)
+        conn.commit()
+
+    for i in range(0, len(attempt_ids), 1000):
+        grading.grade_attempts(cur, attempt_ids[i:i + 1000])
+        conn.commit()
+    return len(attempt_ids)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Fill a database with synthetic students, exams and history.")
+    p.add_argument("--db", default=DB_PATH)
+    p.add_argument("--uploads", default=UPLOAD_DIR)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--students", type=int, default=1000)
+    p.add_argument("--exams", type=int, default=10)
+    p.add_argument("--questions", type=int, default=40, help="questions per exam")
+    p.add_argument("--max-questions", type=int, default=20, help="questions served per attempt")
+    p.add_argument("--attempts", type=int, default=3, help="historical attempts per student")
+    p.add_argument("--events", type=int, default=20, help="proctor events per attempt")
+    p.add_argument("--images", type=int, default=40, help="snapshots per attempt")
+    args = p.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print(f"Using database: {args.db}")
+    conn = connect(args.db)
+    try:
+        students = seed_students(conn, args.students)
+        exams = [seed_exam(conn, rng, f"Seeded exam {n}", args.questions, args.max_questions)
+                 for n in range(1, args.exams + 1)]
+        attempts = seed_history(conn, rng, students, exams, args.attempts, args.events, args.images,
+                                upload_dir=args.uploads) if exams else 0
+    finally:
+        conn.close()
+    print(f"Seeded {len(students)} student(s), {len(exams)} exam(s), {attempts} attempt(s); "
+          f"password for all students: {SEED_PASSWORD}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# server.py
+"""
+Production entry point: pre-fork workers serving app.py.
+
+    python server.py --workers 4 --bind 0.0.0.0:8000
+
+The master imports the app once, so init_db and the demo admin run once per
+server. It then closes its database connections, binds the listening socket
+and forks the workers. Each worker serves the shared socket with werkzeug's
+threaded WSGI server and starts its own writer, snapshot ingest and deadline
+threads.
+
+Across workers:
+  * SQLite writes queue on a lock file next to the database
+    (models.SQLITE_WRITE_LOCK). PostgreSQL needs no lock.
+  * /api/stream notifications are relayed between workers (pubsub.Relay).
+  * caches re-read the database after their TTLs.
+
+A worker that exits is replaced. SIGTERM or SIGINT lets every worker finish
+its queued writes and stops the server. Needs fork(), so POSIX only.
+"""
+import os
+import time
+import signal
+import socket
+import shutil
+import logging
+import argparse
+import tempfile
+
+log = logging.getLogger("server")
+
+WORKERS = int(os.environ.get("WEB_WORKERS", os.cpu_count() or 2))
+BIND = os.environ.get("WEB_BIND", "0.0.0.0:8000")
+# how long a stopping worker may spend finishing queued writes
+SHUTDOWN_SECS = float(os.environ.get("WEB_SHUTDOWN_SECS", 10))
+# workers that die sooner than this after starting are restarted after a pause
+MIN_UPTIME_SECS = 5
+
+
+def _bind(address):
+    host, _, port = address.rpartition(":")
+    host = host.strip("[]") or "0.0.0.0"
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, int(port)))
+    sock.listen(1024)
+    return sock, host, sock.getsockname()[1]
+
+
+def _exit_code(status):
+    return os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+
+
+def _worker(appmod, sock, host, port):
+    """Body of a forked worker; never returns."""
+    from werkzeug.serving import make_server
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    # Ctrl-C reaches the whole process group; the master turns it into SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    status = 0
+    try:
+        server = make_server(host, port, appmod.app, threaded=True, fd=sock.fileno())
+        appmod.start_background()
+        server.serve_forever()
+    except SystemExit:
+        pass
+    except Exception:
+        log.exception("worker %d failed", os.getpid())
+        status = 1
+    try:
+        appmod.stop_background(SHUTDOWN_SECS)
+    except Exception:
+        log.exception("worker %d: queued work not finished", os.getpid())
+        status = status or 1
+    os._exit(status)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Serve the exam app with pre-forked worker processes.")
+    p.add_argument("--workers", type=int, default=WORKERS)
+    p.add_argument("--bind", default=BIND, help="host:port to listen on")
+    args = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(name)s: %(message)s")
+
+    relay_dir = tempfile.mkdtemp(prefix="exam-relay-")
+    os.environ["EXAM_PREFORK"] = "1"
+    os.environ["PUBSUB_RELAY_DIR"] = relay_dir
+    sock, host, port = _bind(args.bind)
+
+    # warm start: schema, migrations and the demo admin, once for all workers
+    import app as appmod
+    import models
+    models.close_pool()
+
+    workers = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _worker(appmod, sock, host, port)
+        workers[pid] = time.monotonic()
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    log.info("serving on %s:%d with %d worker(s), database %s", host, port, args.workers, models.backend.name)
+    try:
+        for _ in range(args.workers):
+            spawn()
+        while workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = workers.pop(pid, None)
+            # a killed worker cannot remove its own relay socket
+            try:
+                os.unlink(os.path.join(relay_dir, f"{pid}.sock"))
+            except FileNotFoundError:
+                pass
+            if stopping or started is None:
+                continue
+            log.warning("worker %d exited with %d, starting a new one", pid, _exit_code(status))
+            if time.monotonic() - started < MIN_UPTIME_SECS:
+                time.sleep(1)
+            if not stopping:
+                spawn()
+    finally:
+        sock.close()
+        shutil.rmtree(relay_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 // static/js/proctor.js
 // expects global variables:
-// ATTEMPT_ID, IMG_UPLOAD, SAVE_ANSWER_URL, LOG_EVENT_URL, SERVER_ALLOWED_UNTIL (optional ISO string)
+// ATTEMPT_ID, IMG_UPLOAD, SAVE_ANSWER_URL, SAVE_ANSWERS_URL, LOG_EVENT_URL, SERVER_ALLOWED_UNTIL (optional ISO string),
+// FRAME_CHANGE (optional {threshold, keyframe_secs})
 
 (function(){
   const video = document.getElementById('video');
@@ -57,9 +58,63 @@
     });
   }
 
-  // capture frame, resize and compress to JPEG, then upload
-  function captureAndUpload() {
+  // frame-change detection: each capture is reduced to a tiny grayscale
+  // signature and only uploaded when it differs enough from the last
+  // uploaded frame, or when a keyframe is due. Skipped counts are logged.
+  const FRAME_CFG = (typeof FRAME_CHANGE !== 'undefined' && FRAME_CHANGE) || {};
+  const CHANGE_THRESHOLD = FRAME_CFG.threshold != null ? FRAME_CFG.threshold : 0.04; // mean abs luma diff, 0..1
+  const KEYFRAME_MS = (FRAME_CFG.keyframe_secs || 120) * 1000;
+  const SIG_W = 32, SIG_H = 24;
+  const sigCanvas = document.createElement('canvas');
+  sigCanvas.width = SIG_W;
+  sigCanvas.height = SIG_H;
+  let lastSignature = null;
+  let lastUploadAt = 0;
+  let skippedFrames = 0;
+
+  function frameSignature() {
+    const ctx = sigCanvas.getContext('2d', { willReadFrequently: true });
+    ctx.drawImage(video, 0, 0, SIG_W, SIG_H);
+    const px = ctx.getImageData(0, 0, SIG_W, SIG_H).data;
+    const sig = new Uint8Array(SIG_W * SIG_H);
+    for (let i = 0, j = 0; j < sig.length; i += 4, j++) {
+      // integer Rec. 601 luma
+      sig[j] = (px[i] * 77 + px[i + 1] * 150 + px[i + 2] * 29) >> 8;
+    }
+    return sig;
+  }
+
+  function signatureDiff(a, b) {
+    let sum = 0;
+    for (let i = 0; i < a.length; i++) sum += Math.abs(a[i] - b[i]);
+    return sum / (a.length * 255);
+  }
+
+  function reportSkippedFrames() {
+    if (!skippedFrames) return;
+    logEvent('frames_skipped', String(skippedFrames));
+    skippedFrames = 0;
+  }
+
+  // capture frame, resize and compress to JPEG, then upload if it changed
+  function captureAndUpload(force) {
     if (!video || !video.videoWidth) return;
+    let sig = null;
+    try {
+      sig = frameSignature();
+    } catch (e) {
+      sig = null; // tainted or unavailable canvas: always upload
+    }
+    const now = Date.now();
+    if (!force && sig && lastSignature && CHANGE_THRESHOLD > 0 &&
+        now - lastUploadAt < KEYFRAME_MS &&
+        signatureDiff(sig, lastSignature) < CHANGE_THRESHOLD) {
+      skippedFrames++;
+      return;
+    }
+    lastSignature = sig;
+    lastUploadAt = now;
+    reportSkippedFrames();
     const MAX_WIDTH = 640; // reduce if you want smaller files
     let w = video.videoWidth;
     let h = video.videoHeight;
@@ -73,58 +128,157 @@
     canvas.height = h;
     const ctx = canvas.getContext('2d');
     ctx.drawImage(video, 0, 0, w, h);
-    // compress to JPEG at quality 0.6
-    const dataUrl = canvas.toDataURL('image/jpeg', 0.6);
+    // compress to JPEG at quality 0.6 and upload the raw bytes as a file part;
+    // data URLs (33% larger) are only used where toBlob is unavailable
     const fd = new FormData();
     fd.append('attempt_id', ATTEMPT_ID);
-    fd.append('image', dataUrl);
-    fetch(IMG_UPLOAD, { method: 'POST', body: fd, credentials: 'same-origin' })
+    const send = () => fetch(IMG_UPLOAD, { method: 'POST', body: fd, credentials: 'same-origin' })
       .then(res => {
         if (!res.ok) {
           console.warn("Image upload returned", res.status, res.statusText);
         }
       })
       .catch(e => console.error("img upload failed", e));
+    if (canvas.toBlob) {
+      canvas.toBlob(blob => {
+        if (!blob) return;
+        fd.append('image', blob, 'snapshot.jpg');
+        send();
+      }, 'image/jpeg', 0.6);
+    } else {
+      fd.append('image', canvas.toDataURL('image/jpeg', 0.6));
+      send();
+    }
   }
 
   function initSnapshotInterval() {
-    captureAndUpload();
-    snapshotInterval = setInterval(captureAndUpload, 15000);
+    captureAndUpload(true);
+    snapshotInterval = setInterval(() => captureAndUpload(false), 15000);
+  }
+
+  // autosave answers: changes are coalesced per question (last write wins)
+  // and flushed as one batch after a short pause, on an interval, when the
+  // tab is hidden and via sendBeacon on unload
+  const ANSWER_DEBOUNCE_MS = 800;
+  const ANSWER_FLUSH_MS = 5000;
+  const pendingAnswers = new Map();
+  let answerDebounce = null;
+  let answerFlushInFlight = null;
+  const saveBtn = document.getElementById('saveAnswers');
+
+  function setSaveStatus(html) {
+    if (saveBtn) saveBtn.innerHTML = html;
+  }
+
+  function takePendingAnswers() {
+    const answers = Array.from(pendingAnswers, ([question_id, selected]) => ({ question_id, selected }));
+    pendingAnswers.clear();
+    return answers;
+  }
+
+  function requeueAnswers(answers) {
+    // keep newer selections made while the failed request was in flight
+    answers.forEach(a => {
+      if (!pendingAnswers.has(a.question_id)) pendingAnswers.set(a.question_id, a.selected);
+    });
+  }
+
+  function flushAnswers() {
+    clearTimeout(answerDebounce);
+    answerDebounce = null;
+    if (answerFlushInFlight) return answerFlushInFlight;
+    if (!pendingAnswers.size) return Promise.resolve();
+    const answers = takePendingAnswers();
+    answerFlushInFlight = fetch(SAVE_ANSWERS_URL, {
+      method: 'POST',
+      headers: {'Content-Type':'application/json'},
+      credentials: 'same-origin',
+      keepalive: true,
+      body: JSON.stringify({ attempt_id: ATTEMPT_ID, answers: answers })
+    })
+      .then(res => {
+        if (!res.ok) throw new Error(res.status + ' ' + res.statusText);
+        setSaveStatus('✅ Saved');
+        setTimeout(() => setSaveStatus('💾 Auto-Save Active'), 2000);
+      })
+      .catch(err => {
+        console.error("save answers failed", err);
+        requeueAnswers(answers);
+        setSaveStatus('⚠️ Save Failed');
+      })
+      .finally(() => {
+        answerFlushInFlight = null;
+        if (pendingAnswers.size && !answerDebounce) {
+          answerDebounce = setTimeout(flushAnswers, ANSWER_DEBOUNCE_MS);
+        }
+      });
+    return answerFlushInFlight;
+  }
+
+  function beaconAnswers() {
+    if (!pendingAnswers.size) return;
+    const answers = takePendingAnswers();
+    const blob = new Blob([JSON.stringify({ attempt_id: ATTEMPT_ID, answers: answers })], { type: 'application/json' });
+    if (!navigator.sendBeacon || !navigator.sendBeacon(SAVE_ANSWERS_URL, blob)) {
+      requeueAnswers(answers);
+      flushAnswers();
+    }
   }
 
-  // autosave answers
   document.querySelectorAll('.question input[type=radio]').forEach(radio => {
-    radio.addEventListener('change', async (e) => {
+    radio.addEventListener('change', (e) => {
       const qDiv = e.target.closest('.question');
-      const questionId = qDiv.dataset.qid;
-      const selected = e.target.value;
-      try {
-        await fetch(SAVE_ANSWER_URL, {
-          method: 'POST',
-          headers: {'Content-Type':'application/json'},
-          body: JSON.stringify({ attempt_id: ATTEMPT_ID, question_id: questionId, selected: selected })
-        });
-      } catch (err) { console.error("save answer failed", err); }
+      pendingAnswers.set(qDiv.dataset.qid, e.target.value);
+      clearTimeout(answerDebounce);
+      answerDebounce = setTimeout(flushAnswers, ANSWER_DEBOUNCE_MS);
     });
   });
+  setInterval(flushAnswers, ANSWER_FLUSH_MS);
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') beaconAnswers();
+  });
+  window.addEventListener('pagehide', beaconAnswers);
 
-  // log events
-  async function logEvent(ev, detail="") {
-    const payload = { attempt_id: ATTEMPT_ID, event: ev, detail: detail };
-    try {
-      const blob = new Blob([JSON.stringify(payload)], { type: 'application/json' });
-      navigator.sendBeacon(LOG_EVENT_URL, blob);
-    } catch (e) {
-      fetch(LOG_EVENT_URL, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(payload) }).catch(()=>{});
+  // log events: buffered with their client timestamp and sent as one batch
+  // a couple of seconds after the first one (an alt-tab is hidden + blur +
+  // visible + focus), when the buffer fills up, or right away on hide/unload
+  const EVENT_FLUSH_MS = 2000;
+  const EVENT_BATCH_MAX = 50;
+  let pendingEvents = [];
+  let eventFlushTimer = null;
+
+  function logEvent(ev, detail="") {
+    pendingEvents.push({ event: ev, detail: detail, ts: new Date().toISOString() });
+    if (pendingEvents.length >= EVENT_BATCH_MAX) {
+      flushEvents();
+    } else if (!eventFlushTimer) {
+      eventFlushTimer = setTimeout(flushEvents, EVENT_FLUSH_MS);
     }
   }
 
+  function flushEvents() {
+    clearTimeout(eventFlushTimer);
+    eventFlushTimer = null;
+    if (!pendingEvents.length) return;
+    const payload = JSON.stringify({ attempt_id: ATTEMPT_ID, events: pendingEvents });
+    pendingEvents = [];
+    try {
+      const blob = new Blob([payload], { type: 'application/json' });
+      if (navigator.sendBeacon && navigator.sendBeacon(LOG_EVENT_URL, blob)) return;
+    } catch (e) {}
+    fetch(LOG_EVENT_URL, { method:'POST', headers:{'Content-Type':'application/json'}, body: payload, keepalive: true }).catch(()=>{});
+  }
+
   document.addEventListener('visibilitychange', () => {
     const ev = document.visibilityState === 'visible' ? 'tab_visible' : 'tab_hidden';
     logEvent(ev, document.visibilityState);
   });
   window.addEventListener('blur', () => logEvent('window_blur', ''));
   window.addEventListener('focus', () => logEvent('window_focus', ''));
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') flushEvents();
+  });
+  window.addEventListener('pagehide', flushEvents);
 
   // client-side timer using SERVER_ALLOWED_UNTIL when available
   let clientTimerInterval = null;
@@ -165,28 +319,41 @@
 
   window.addEventListener('beforeunload', (e) => {
     try {
+      beaconAnswers();
       captureAndUpload();
+      reportSkippedFrames();
       logEvent('beforeunload', '');
+      flushEvents();
       if (stream) {
         try { stream.getTracks().forEach(t => t.stop()); } catch(_) {}
       }
     } catch (err) {}
   });
 
-  // Stop proctoring before actual form submission to avoid concurrent writes
+  // Stop proctoring before actual form submission to avoid concurrent writes;
+  // unsaved answers are flushed first so grading sees them
   const examForm = document.getElementById('examForm');
+  let submitting = false;
   if (examForm) {
-    examForm.addEventListener('submit', () => {
+    examForm.addEventListener('submit', (e) => {
+      if (submitting) return;
+      submitting = true;
       try {
         if (snapshotInterval) {
           clearInterval(snapshotInterval);
           snapshotInterval = null;
         }
+        reportSkippedFrames();
+        flushEvents();
         if (stream) {
           try { stream.getTracks().forEach(t => t.stop()); } catch(_) {}
         }
         setStatus('Proctoring stopped, submitting exam...', 'success');
       } catch (_) {}
+      if (pendingAnswers.size || answerFlushInFlight) {
+        e.preventDefault();
+        flushAnswers().then(flushAnswers).finally(() => examForm.submit());
+      }
     });
   }
 
@@ -42,7 +42,7 @@ document.addEventListener('DOMContentLoaded', function() {
   // Add confirmation for important actions
   setupActionConfirmations();
 
-  // Initialize real-time stats polling for dashboards
+  // Initialize real-time stats (server push, polling fallback) for dashboards
   initRealtimeStats();
   // Enable keyboard navigation for exam questions
   initKeyboardNavigation();
@@ -219,55 +219,87 @@ function setupActionConfirmations() {
 }
 
 /**
- * Real-time stats polling for dashboards
+ * Real-time stats for dashboards: server-sent events from /api/stream,
+ * falling back to polling the stats endpoints when EventSource is
+ * unavailable or the stream cannot be kept open
  */
 function initRealtimeStats() {
   const adminStats = document.getElementById('admin-stats');
   const studentStats = document.getElementById('student-stats');
+  if (!adminStats && !studentStats) return;
 
   const setText = (el, value) => { if (el) el.textContent = value; };
 
-  function fetchAdminStats() {
-    if (!adminStats) return;
-    fetch('/api/admin/stats')
-      .then(r => r.ok ? r.json() : Promise.reject())
-      .then(data => {
-        setText(document.getElementById('stat-total-exams'), data.exams ?? '-');
-        setText(document.getElementById('stat-total-attempts'), data.attempts ?? '-');
-        setText(document.getElementById('stat-active-attempts'), data.active_attempts ?? '-');
-        const avg = data.avg_score;
-        setText(document.getElementById('stat-avg-score'), avg != null ? `${avg}%` : '-');
-      })
-      .catch(() => {
-        setText(document.getElementById('stat-total-exams'), '-');
-        setText(document.getElementById('stat-total-attempts'), '-');
-        setText(document.getElementById('stat-active-attempts'), '-');
-        setText(document.getElementById('stat-avg-score'), '-');
-      });
+  function renderAdminStats(data) {
+    setText(document.getElementById('stat-total-exams'), data.exams ?? '-');
+    setText(document.getElementById('stat-total-attempts'), data.attempts ?? '-');
+    setText(document.getElementById('stat-active-attempts'), data.active_attempts ?? '-');
+    const avg = data.avg_score;
+    setText(document.getElementById('stat-avg-score'), avg != null ? `${avg}%` : '-');
+  }
+
+  function renderStudentStats(data) {
+    setText(document.getElementById('student-total-exams'), data.total_exams ?? '-');
+    setText(document.getElementById('student-my-attempts'), data.attempts ?? '-');
+    setText(document.getElementById('student-pending'), data.pending ?? '-');
+    const avg = data.avg_score;
+    setText(document.getElementById('student-avg-score'), avg != null ? `${avg}%` : '-');
   }
 
-  function fetchStudentStats() {
-    if (!studentStats) return;
-    fetch('/api/student/stats')
+  const renderStats = adminStats ? renderAdminStats : renderStudentStats;
+
+  function fetchStats() {
+    fetch(adminStats ? '/api/admin/stats' : '/api/student/stats')
       .then(r => r.ok ? r.json() : Promise.reject())
-      .then(data => {
-        setText(document.getElementById('student-total-exams'), data.total_exams ?? '-');
-        setText(document.getElementById('student-my-attempts'), data.attempts ?? '-');
-        setText(document.getElementById('student-pending'), data.pending ?? '-');
-        const avg = data.avg_score;
-        setText(document.getElementById('student-avg-score'), avg != null ? `${avg}%` : '-');
-      })
-      .catch(() => {
-        setText(document.getElementById('student-total-exams'), '-');
-        setText(document.getElementById('student-my-attempts'), '-');
-        setText(document.getElementById('student-pending'), '-');
-        setText(document.getElementById('student-avg-score'), '-');
-      });
+      .then(renderStats)
+      .catch(() => renderStats({}));
+  }
+
+  let pollInterval = null;
+  function startPolling() {
+    if (pollInterval) return;
+    fetchStats();
+    pollInterval = setInterval(fetchStats, 5000);
+  }
+
+  const activityList = document.getElementById('live-activity');
+  const ACTIVITY_LABELS = {
+    attempt_started: d => `▶️ ${d.username || 'A student'} started ${d.exam_title || 'an exam'} (#${d.attempt_id})`,
+    attempt_submitted: d => `✅ Attempt #${d.attempt_id} ${d.auto ? 'closed at deadline' : 'submitted'}${d.score != null ? ` — ${d.score}%` : ''}`,
+    proctor_event: d => `⚠️ Attempt #${d.attempt_id}: ${d.event}`,
+    exam_created: d => `➕ Exam created: ${d.title}`,
+    regraded: d => `🔁 Re-graded ${d.attempts} attempt(s)`
+  };
+  function addActivity(type, data) {
+    if (!activityList) return;
+    const item = document.createElement('li');
+    item.className = 'small';
+    item.textContent = `${new Date().toLocaleTimeString()} ${ACTIVITY_LABELS[type](data)}`;
+    activityList.prepend(item);
+    while (activityList.children.length > 20) activityList.lastElementChild.remove();
   }
 
-  fetchAdminStats();
-  fetchStudentStats();
-  setInterval(() => { fetchAdminStats(); fetchStudentStats(); }, 5000);
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+  const source = new EventSource('/api/stream');
+  let failures = 0;
+  source.addEventListener('stats', e => {
+    failures = 0;
+    renderStats(JSON.parse(e.data));
+  });
+  Object.keys(ACTIVITY_LABELS).forEach(type => {
+    source.addEventListener(type, e => addActivity(type, JSON.parse(e.data)));
+  });
+  source.onerror = () => {
+    // EventSource reconnects on its own; give up after repeated failures
+    failures += 1;
+    if (source.readyState === EventSource.CLOSED || failures >= 3) {
+      source.close();
+      startPolling();
+    }
+  };
 }
 
 /**
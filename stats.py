@@ -0,0 +1,124 @@
+# stats.py
+"""
+In-memory dashboard counters.
+
+The dashboards poll /api/admin/stats and /api/student/stats every few
+seconds. Instead of re-counting the attempts table on every poll, counters
+are loaded once, kept current by the write paths (exam created, attempt
+started, attempt submitted) and re-synced from the database after a short
+TTL to correct any drift (e.g. writes made by another process).
+"""
+import os
+import time
+from threading import Lock
+
+STATS_TTL = float(os.environ.get("STATS_TTL", 10))
+
+
+def _avg(total, count):
+    return round(total / count, 1) if count else None
+
+
+class StatsCache:
+    def __init__(self, connect, ttl=STATS_TTL):
+        self._connect = connect
+        self.ttl = ttl
+        self._lock = Lock()
+        self._loaded_at = 0.0
+        self._totals = None
+        # user_id -> {"attempts", "pending", "score_sum", "score_count"}
+        self._users = {}
+
+    # ---- reads ----
+    def admin(self):
+        with self._lock:
+            t = self._ensure()
+            return {
+                "exams": t["exams"],
+                "attempts": t["attempts"],
+                "submitted": t["submitted"],
+                "active_attempts": t["attempts"] - t["submitted"],
+                "avg_score": _avg(t["score_sum"], t["score_count"]),
+            }
+
+    def student(self, user_id):
+        with self._lock:
+            t = self._ensure()
+            u = self._user(user_id)
+            return {
+                "total_exams": t["exams"],
+                "attempts": u["attempts"],
+                "pending": u["pending"],
+                "avg_score": _avg(u["score_sum"], u["score_count"]),
+            }
+
+    # ---- write-path hooks ----
+    def exam_created(self):
+        with self._lock:
+            if self._totals is not None:
+                self._totals["exams"] += 1
+
+    def attempt_started(self, user_id):
+        with self._lock:
+            if self._totals is not None:
+                self._totals["attempts"] += 1
+            u = self._users.get(user_id)
+            if u is not None:
+                u["attempts"] += 1
+                u["pending"] += 1
+
+    def attempt_submitted(self, user_id, score):
+        """Call once when an open attempt is submitted and graded."""
+        with self._lock:
+            if self._totals is not None:
+                self._totals["submitted"] += 1
+                if score is not None:
+                    self._totals["score_sum"] += score
+                    self._totals["score_count"] += 1
+            u = self._users.get(user_id)
+            if u is not None:
+                u["pending"] -= 1
+                if score is not None:
+                    u["score_sum"] += score
+                    u["score_count"] += 1
+
+    def invalidate(self):
+        """Drop everything; the next read reloads from the database (used after re-grades)."""
+        with self._lock:
+            self._totals = None
+            self._users = {}
+
+    # ---- loading (caller holds the lock) ----
+    def _ensure(self):
+        if self._totals is None or time.monotonic() - self._loaded_at > self.ttl:
+            conn = self._connect()
+            try:
+                row = conn.execute("""
+                    SELECT (SELECT COUNT(*) FROM exams) AS exams,
+                           COUNT(*) AS attempts,
+                           COALESCE(SUM(CASE WHEN submitted=1 THEN 1 ELSE 0 END), 0) AS submitted,
+                           COALESCE(SUM(CASE WHEN submitted=1 THEN score END), 0) AS score_sum,
+                           COUNT(CASE WHEN submitted=1 THEN score END) AS score_count
+                    FROM attempts""").fetchone()
+            finally:
+                conn.close()
+            self._totals = dict(row)
+            self._users = {}
+            self._loaded_at = time.monotonic()
+        return self._totals
+
+    def _user(self, user_id):
+        u = self._users.get(user_id)
+        if u is None:
+            conn = self._connect()
+            try:
+                row = conn.execute("""
+                    SELECT COUNT(*) AS attempts,
+                           COALESCE(SUM(CASE WHEN submitted=0 THEN 1 ELSE 0 END), 0) AS pending,
+                           COALESCE(SUM(CASE WHEN submitted=1 THEN score END), 0) AS score_sum,
+                           COUNT(CASE WHEN submitted=1 THEN score END) AS score_count
+                    FROM attempts WHERE user_id=?""", (user_id,)).fetchone()
+            finally:
+                conn.close()
+            u = self._users[user_id] = dict(row)
+        return u
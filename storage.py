@@ -0,0 +1,251 @@
+# storage.py
+"""
+Content-addressed snapshot store.
+
+Files are named by the SHA-256 of their bytes and sharded two levels deep
+(ab/cd/abcd....jpg) so no single directory grows unbounded. Uploading bytes
+that already exist stores nothing new; the proctor_images row simply points
+at the existing key, which is also the path serve_image hands out.
+
+Legacy flat "<uuid>.jpg" files in the root keep working: a key is just a
+path relative to the store root.
+
+PackStore is the optional alternative (SNAPSHOT_STORAGE=pack): every
+snapshot of an attempt is appended to one packs/<attempt_id>.pack file and
+the key names the byte range ("packs/<attempt_id>.pack/<offset>-<length>.jpg"),
+so reviewing or archiving an attempt is sequential I/O on one file. Both
+stores can read both kinds of key, so switching modes keeps old rows working.
+"""
+import io
+import os
+import re
+import time
+import uuid
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+CHUNK = 64 * 1024
+TMP_DIR = ".tmp"
+PACK_DIR = "packs"
+# open pack mappings kept around for serving
+MAX_MAPPED_PACKS = 64
+# in-process pack append locks; attempts share lock attempt_id % APPEND_LOCK_STRIPES
+APPEND_LOCK_STRIPES = 64
+
+_PACK_KEY = re.compile(r"^packs/(\d+)\.pack/(\d+)-(\d+)\.jpg$")
+
+
+def dhash(image, size=8):
+    """64-bit difference hash of a PIL image as 16 hex chars (perceptual fingerprint)."""
+    small = image.convert("L").resize((size + 1, size))
+    px = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = px[row * (size + 1) + col]
+            right = px[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def tiny_rgb(image, size=(8, 6)):
+    """A few dozen RGB pixels of a PIL image; dHash ignores brightness and colour, these do not."""
+    return image.convert("RGB").resize(size).tobytes()
+
+
+def pixel_diff(a, b):
+    """Mean absolute difference (0-255) of two tiny_rgb signatures."""
+    return sum(abs(x - y) for x, y in zip(a, b)) / max(len(a), 1)
+
+
+class SnapshotStore:
+    # near-duplicate frames may point at one stored file (gc() removes the copy)
+    shares_frames = True
+
+    def __init__(self, root):
+        self.root = root
+        # attempt_id -> (file, mmap) of recently served packs
+        self._maps = OrderedDict()
+        self._maps_lock = threading.Lock()
+
+    def key_for(self, digest, ext="jpg"):
+        return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    # ---- reading (both key kinds) ----
+    @staticmethod
+    def pack_range(key):
+        """(attempt_id, offset, length) for a pack key, None for a plain file key."""
+        m = _PACK_KEY.match(key or "")
+        return (int(m.group(1)), int(m.group(2)), int(m.group(3))) if m else None
+
+    def pack_path(self, attempt_id):
+        return os.path.join(self.root, PACK_DIR, f"{int(attempt_id)}.pack")
+
+    def read_range(self, attempt_id, offset, length):
+        """Bytes of one packed snapshot, sliced from a cached memory map of the pack."""
+        end = offset + length
+        with self._maps_lock:
+            entry = self._maps.get(attempt_id)
+            if entry is None or len(entry[1]) < end:
+                # packs only grow; remap when the range is past the mapped size
+                if entry is not None:
+                    entry[1].close(); entry[0].close()
+                f = open(self.pack_path(attempt_id), "rb")
+                try:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    f.close()
+                    raise
+                entry = self._maps[attempt_id] = (f, mm)
+                while len(self._maps) > MAX_MAPPED_PACKS:
+                    _, (of, omm) = self._maps.popitem(last=False)
+                    omm.close(); of.close()
+            self._maps.move_to_end(attempt_id)
+            if len(entry[1]) < end:
+                raise FileNotFoundError(f"range {offset}+{length} beyond pack {attempt_id}")
+            return entry[1][offset:end]
+
+    def read(self, key):
+        rng = self.pack_range(key)
+        if rng:
+            return self.read_range(*rng)
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def open(self, key):
+        """Readable binary file object for a key."""
+        if self.pack_range(key):
+            return io.BytesIO(self.read(key))
+        return open(self.path(key), "rb")
+
+    def size(self, key):
+        rng = self.pack_range(key)
+        return rng[2] if rng else os.path.getsize(self.path(key))
+
+    def put_stream(self, src, attempt_id=None):
+        """Store a file-like object; returns (key, size). Identical content is stored once."""
+        tmp_dir = os.path.join(self.root, TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp = os.path.join(tmp_dir, uuid.uuid4().hex)
+        h = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                while True:
+                    chunk = src.read(CHUNK)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            if not size:
+                return None, 0
+            key = self.key_for(h.hexdigest())
+            dest = self.path(key)
+            if os.path.exists(dest):
+                # deduplicated; refresh mtime so gc() treats it as recently used
+                os.utime(dest)
+            else:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(tmp, dest)
+            return key, size
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def put_bytes(self, data, attempt_id=None):
+        digest = hashlib.sha256(data).hexdigest()
+        key = self.key_for(digest)
+        dest = self.path(key)
+        if os.path.exists(dest):
+            os.utime(dest)
+            return key, len(data)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = os.path.join(self.root, TMP_DIR, uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, dest)
+        return key, len(data)
+
+    def gc(self, referenced, grace_secs=3600, thumb_dir="thumbs"):
+        """
+        Delete sharded files whose key is not in `referenced` (e.g. frames
+        replaced by a near-duplicate) and that are older than grace_secs, plus
+        their thumbnails. Returns the number of files removed.
+        """
+        removed = 0
+        cutoff = time.time() - grace_secs
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            rel = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            if rel == ".":
+                # only walk the two-level hex shards
+                dirnames[:] = [d for d in dirnames if len(d) == 2]
+                continue
+            for name in filenames:
+                key = f"{rel}/{name}"
+                path = os.path.join(dirpath, name)
+                if key in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+                thumb = self.path(f"{thumb_dir}/{key}")
+                if os.path.exists(thumb):
+                    os.remove(thumb)
+                removed += 1
+        return removed
+
+
+class PackStore(SnapshotStore):
+    """Append-only per-attempt pack files; no content dedup, one file per attempt."""
+
+    # every frame's bytes are already in the pack and its row records their
+    # range, so re-pointing a near-duplicate saves nothing
+    shares_frames = False
+
+    def __init__(self, root):
+        super().__init__(root)
+        self._append_locks = [threading.Lock() for _ in range(APPEND_LOCK_STRIPES)]
+
+    def _append_lock(self, attempt_id):
+        return self._append_locks[int(attempt_id) % APPEND_LOCK_STRIPES]
+
+    def put_stream(self, src, attempt_id=None):
+        path = self.pack_path(attempt_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._append_lock(attempt_id), open(path, "ab") as f:
+            if fcntl is not None:
+                # other worker processes may append to the same pack
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                size = 0
+                while True:
+                    chunk = src.read(CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    size += len(chunk)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        if not size:
+            return None, 0
+        return f"{PACK_DIR}/{int(attempt_id)}.pack/{offset}-{size}.jpg", size
+
+    def put_bytes(self, data, attempt_id=None):
+        return self.put_stream(io.BytesIO(data), attempt_id)
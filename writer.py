@@ -0,0 +1,222 @@
+# writer.py
+"""
+Single writer thread with group commit.
+
+Request handlers enqueue write intents (callables taking a cursor) and return;
+one background thread drains the queue every few milliseconds and applies
+everything pending in a single transaction. Each intent runs inside its own
+SAVEPOINT so a bad row only fails that intent, not the whole batch.
+
+High-volume single-row inserts (proctor events) can instead be appended to
+a per-statement buffer: everything buffered until the writer picks it up is
+inserted with one executemany in that batch's transaction.
+"""
+import os
+import queue
+import time
+import logging
+import threading
+import models
+import metrics
+
+log = logging.getLogger(__name__)
+
+# how long the writer waits for more intents before committing a batch
+GROUP_COMMIT_MS = float(os.environ.get("WRITER_GROUP_COMMIT_MS", 5))
+MAX_BATCH = 500
+MAX_RETRIES = 5
+
+_STOP = object()
+
+
+class WriteIntent:
+    __slots__ = ("fn", "done", "result", "error")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        """Block until the intent's batch has committed; re-raise its error if any."""
+        if not self.done.wait(timeout):
+            raise TimeoutError("write was not acknowledged in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class WriteQueue:
+    def __init__(self, connect, interval_ms=GROUP_COMMIT_MS, max_batch=MAX_BATCH):
+        self._connect = connect
+        self.interval = interval_ms / 1000.0
+        self.max_batch = max_batch
+        self._q = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # sql -> rows waiting for the next buffered insert of that statement
+        self._buffers = {}
+        self._buf_lock = threading.Lock()
+
+    # ---- producer side ----
+    def submit(self, fn, durable=False, timeout=30):
+        """
+        Queue fn(cur) for the writer thread. With durable=True wait for the
+        commit and return fn's result, otherwise return the pending intent.
+        """
+        self._ensure_started()
+        intent = WriteIntent(fn)
+        self._q.put(intent)
+        if durable:
+            return intent.wait(timeout)
+        return intent
+
+    def execute(self, sql, params=(), durable=False):
+        return self.submit(lambda cur: cur.execute(sql, params).lastrowid, durable=durable)
+
+    def append(self, sql, rows):
+        """
+        Buffer rows (a list of parameter tuples) for `sql`. Rows buffered
+        before the writer reaches the statement's pending intent share one
+        executemany; returns that intent.
+        """
+        self._ensure_started()
+        with self._buf_lock:
+            pending = self._buffers.get(sql)
+            if pending is not None:
+                pending[1].extend(rows)
+                return pending[0]
+            intent = self._buffers[sql] = (self._buffered_insert(sql), list(rows))
+        self._q.put(intent[0])
+        return intent[0]
+
+    def _buffered_insert(self, sql):
+        taken = []
+
+        def insert(cur):
+            # take the rows once; a retried batch re-inserts the same rows
+            if not taken:
+                with self._buf_lock:
+                    taken.append(self._buffers.pop(sql)[1])
+            cur.executemany(sql, taken[0])
+            return len(taken[0])
+        return WriteIntent(insert)
+
+    def depth(self):
+        """Intents waiting for the writer thread."""
+        return self._q.qsize()
+
+    def flush(self, timeout=30):
+        """Wait until everything queued so far has been committed."""
+        return self.submit(lambda cur: None, durable=True, timeout=timeout)
+
+    def stop(self, timeout=5):
+        if self._thread is not None and self._thread.is_alive():
+            self._q.put(_STOP)
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        # restart after fork (threads do not survive into child processes) or
+        # if the thread died, so queued intents are not left waiting forever
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    # ---- writer thread ----
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            first = self._q.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    nxt = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stopping = True
+                    break
+                batch.append(nxt)
+            conn = self._commit(conn, batch)
+        if conn is not None:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        """Apply one batch; returns the connection for the next one (None after losing it)."""
+        for attempt in range(MAX_RETRIES):
+            try:
+                if conn is None:
+                    conn = self._connect()
+                # one writer process at a time (SQLite); no-op on PostgreSQL
+                with models.backend.write_lock():
+                    outcomes = self._apply(conn, batch)
+                break
+            except Exception as e:
+                # anything, not just OperationalError: an escaping error would
+                # kill the writer thread and strand every later intent
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        # the connection itself is gone (e.g. PostgreSQL restarted)
+                        conn = self._discard(conn)
+                if conn is None and attempt < MAX_RETRIES - 1:
+                    log.warning("writer connection lost (%s), reconnecting", e)
+                    time.sleep(0.05 * (attempt + 1))
+                    continue
+                if models.backend.is_lock_error(e) and attempt < MAX_RETRIES - 1:
+                    metrics.write_retries.inc()
+                    time.sleep(0.05 * (attempt + 1))
+                    continue
+                log.exception("write batch of %d failed", len(batch))
+                outcomes = [(None, e)] * len(batch)
+                break
+        for intent, (result, error) in zip(batch, outcomes):
+            intent.result, intent.error = result, error
+            if error is not None and not isinstance(error, models.backend.IntegrityError):
+                log.warning("write intent failed: %s", error)
+            intent.done.set()
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            # the pool rolls back or drops a broken connection
+            conn.close()
+        except Exception:
+            pass
+        return None
+
+    def _apply(self, conn, batch):
+        cur = conn.cursor()
+        models.backend.begin_write(cur)
+        outcomes = []
+        for intent in batch:
+            cur.execute("SAVEPOINT intent")
+            try:
+                result = intent.fn(cur)
+                cur.execute("RELEASE intent")
+                outcomes.append((result, None))
+            except models.backend.OperationalError as e:
+                if models.backend.is_lock_error(e):
+                    raise
+                cur.execute("ROLLBACK TO intent"); cur.execute("RELEASE intent")
+                outcomes.append((None, e))
+            except Exception as e:
+                cur.execute("ROLLBACK TO intent"); cur.execute("RELEASE intent")
+                outcomes.append((None, e))
+        conn.commit()
+        metrics.writer_batch.observe(len(batch))
+        return outcomes